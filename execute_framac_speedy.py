@@ -13,6 +13,52 @@
 # When executing Frama-c via Python plugin, the plugin interprets the Frama-C output and generates
 # Codesonar warnings if a warning, error or specification violation is found.
 #
+# Compilation units whose files don't contain any ACSL annotation (/*@ or //@) have nothing
+# to prove. The "UNANNOTATED_CU_ACTION" option decides what happens to them: "Skip" doesn't
+# run Frama-C at all, "RTE" only runs a cheap RTE-only pass (or Speedy checks without WP), and
+# "Prove" (the default) runs the complete analysis as for any other compilation unit.
+#
+# If "INCREMENTAL" option is set to "Yes" (only when not using Speedy), the plugin keeps, in
+# "INCREMENTAL_DIR", digests of each procedure and the warnings created for each compilation unit.
+# On the next run, only the changed procedures and the callers (from codesonar call graph) of the
+# procedures whose contract changed are proved again (see incremental_analysis.py). Other warnings
+# are taken from previous run, moved with their procedure if lines were added or removed before it.
+#
+# Frama-C and Speedy processes are started through a job governor (see job_governor.py). Codesonar
+# visits the compilation units one after the other, so they run one at a time. A process using,
+# with the provers it started, more than "PROCESS_MEMORY_CAP_MB" is killed and its compilation unit
+# is marked as failed. Peak memory of each compilation unit is kept in "JOB_HISTORY_FILE" (written
+# every minute and at the end of the analysis).
+# The governor also gives each process as many cores as it had goals on the previous run, within
+# "CORE_BUDGET" cores (all the cores by default), and sets its -wp-par, unless -wp-par is given in
+# "FRAMAC_WP_FLAGS". Core utilization is printed at the end of the analysis.
+#
+# Executables (Frama-C, Alt-Ergo, Java and SpeedyCore.jar) are looked for, and their versions printed,
+# once when the plugin is set up (see launcher.py). The analysis stops at once if Frama-C, Java or
+# SpeedyCore.jar is missing. A missing Alt-Ergo only prints a warning.
+#
+# Several WP profiles can be given in "FRAMAC_WP_PROFILES", each one with a unique "NAME" (letters,
+# digits, "_", "-" and "."), its own "FRAMAC_WP_FLAGS" and optionally "WP_RTE" : "No" to run WP
+# without -wp-rte (not supported with Speedy, which chooses the WP options itself), e.g.:
+#   "FRAMAC_WP_PROFILES" : [{"NAME" : "rte", "FRAMAC_WP_FLAGS" : ["-wp-timeout", "10"]},
+#                           {"NAME" : "no-rte", "WP_RTE" : "No", "FRAMAC_WP_FLAGS" : []}]
+# The compilation unit is then parsed once and saved with -save, and WP of each profile runs
+# from the loaded state. Warnings are tagged with the name of the profile. With Speedy, which
+# parses the compilation unit itself, Speedy is executed once per profile.
+# Top-level "FRAMAC_WP_FLAGS" is only used when no profile is given.
+#
+# Warnings, kernel errors included, are created as soon as they are read from the output, while
+# Frama-C (or Speedy) is still running, so warnings of a process which is killed or fails are kept.
+# If "FAIL_FAST" option is set to "Yes", Frama-C (or Speedy) is stopped at the first fatal kernel
+# error ("user error" or "failure"), the compilation unit is marked as failed and the analysis
+# continues with the next compilation unit, instead of being aborted. The status of each compilation unit, and the reason of each failure,
+# is written to "run_summary.json" in "TEMP_DIR" and printed at the end of the analysis.
+#
+# While the analysis runs, "status.json" in "TEMP_DIR" is rewritten every "STATUS_INTERVAL_SECONDS"
+# seconds (10 by default, 0 to disable it) with the compilation units done and remaining, the goals
+# proved and failed so far, the running jobs, the parsing throughput and an estimated completion time
+# (see progress.py).
+#
 # This plugin is created as part of SaTC project.
 # Note that Speedy was created as part of a NASA-funded project, for which GrammaTech has SBIR rights.
 # Frama-C is a third-party, open source, separately licensed, tool available from http://frama-c.com
@@ -43,7 +89,6 @@
 #    - Speedy Error
 
 import shutil
-import subprocess
 import os
 import sys
 import re
@@ -52,14 +97,35 @@ import tempfile
 import inspect
 import time
 import errno
+import atexit
 import cs
 import process_wp_output
+import incremental_analysis
+import job_governor
+import run_summary
+import launcher
+import progress
  
 #Current File Directory
 FILE_DIR = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
 
 CONFIG_INFO = {}
 SFILE_DICT = {}
+# Maps the path of each sfile to its key in SFILE_DICT
+SFILE_KEYS = {}
+# Admission control and memory accounting of the started Frama-C/Speedy processes
+GOVERNOR = None
+# Executables, environment and fixed arguments of the started processes, computed once in setup
+LAUNCHER = None
+# Status of each analysed compilation unit, written to TEMP_DIR/run_summary.json
+SUMMARY = None
+# Thread writing the progress of the analysis to TEMP_DIR/status.json
+PROGRESS = None
+# Whether report_end_of_run was already called
+END_OF_RUN_REPORTED = False
+# Maps sfile hash to whether the sfile contains ACSL annotations, so that
+# sfiles shared by several compilation units are scanned only once.
+ANNOTATION_CACHE = {}
 DEBUG = False
 SRC_DIR = "src"
 
@@ -74,9 +140,27 @@ FILE_LINE_INFO_PATTERN = re.compile(FILE_LINE_INFO_REGEX)
 SPEEDY_CHECKER_MESSAGE_REGEX = r'(\S+):(\d+):(\d+)-(\d+):(.*)'
 SPEEDY_CHECKER_MESSAGE_PATTERN = re.compile(SPEEDY_CHECKER_MESSAGE_REGEX)
 
+ACSL_ANNOTATION_REGEX = r'/\*@|//@'
+ACSL_ANNOTATION_PATTERN = re.compile(ACSL_ANNOTATION_REGEX)
+
+# Profile names are used in file and directory names
+PROFILE_NAME_REGEX = r'^[A-Za-z0-9_.-]+$'
+PROFILE_NAME_PATTERN = re.compile(PROFILE_NAME_REGEX)
+
+# Possible values of "UNANNOTATED_CU_ACTION" option
+UNANNOTATED_CU_PROVE = "Prove"  # run the complete analysis anyway
+UNANNOTATED_CU_RTE = "RTE"      # run a cheap RTE-only pass
+UNANNOTATED_CU_SKIP = "Skip"    # do not run Frama-C at all
+
 @ cs.project_visitor
 def setup(proj):
     get_configuration_info(proj.name())
+    # Fail now if a tool is missing, rather than on each compilation unit
+    global LAUNCHER
+    LAUNCHER = launcher.LaunchTemplate(CONFIG_INFO["FRAMAC_LOC"], CONFIG_INFO.get("JAVA_LOC", None),
+                                       CONFIG_INFO.get("SPEEDY_JAR_LOC", None), CONFIG_INFO["USE_SPEEDY"],
+                                       CONFIG_INFO["TEMP_DIR"] + "/" + SRC_DIR, CONFIG_INFO["TEMP_DIR"])
+    print LAUNCHER.report()
     # Remove TEMP_DIR if existing
     temp_dir = CONFIG_INFO.get("TEMP_DIR", "")
 
@@ -104,10 +188,29 @@ def setup(proj):
         if not CONFIG_INFO["USE_SPEEDY"]:
             sfile_dict[str(hash(sfile)) +".c"] = sfile
         else:
-            path = os.path.join(CONFIG_INFO["TEMP_DIR"], SRC_DIR, str(hash(sfile)) +".c")
+            # Speedy prints absolute paths, whatever TEMP_DIR is
+            path = os.path.abspath(os.path.join(CONFIG_INFO["TEMP_DIR"], SRC_DIR, str(hash(sfile)) +".c"))
             sfile_dict[path.replace("\\", "/")] = sfile
     global SFILE_DICT
     SFILE_DICT = sfile_dict
+    global SFILE_KEYS
+    SFILE_KEYS = dict([(str(sfile), key) for key, sfile in sfile_dict.items()])
+    global ANNOTATION_CACHE
+    ANNOTATION_CACHE = {}
+    global GOVERNOR
+    GOVERNOR = job_governor.JobGovernor(CONFIG_INFO["PROCESS_MEMORY_CAP_MB"], CONFIG_INFO["JOB_HISTORY_FILE"],
+                                        CONFIG_INFO["CORE_BUDGET"])
+    global SUMMARY
+    SUMMARY = run_summary.RunSummary(os.path.join(temp_dir, "run_summary.json"))
+    global PROGRESS
+    total_compunits = len([cu for cu in project.compunits() if cu.is_user() and cs.language.C == cu.get_language()])
+    PROGRESS = progress.ProgressMonitor(os.path.join(temp_dir, "status.json"), CONFIG_INFO["STATUS_INTERVAL_SECONDS"],
+                                        total_compunits, SUMMARY, GOVERNOR)
+    if CONFIG_INFO["STATUS_INTERVAL_SECONDS"] > 0:
+        PROGRESS.start()
+    global END_OF_RUN_REPORTED
+    END_OF_RUN_REPORTED = False
+    atexit.register(report_end_of_run)
 
     # make a temp dir to put source files
     os.makedirs(temp_dir+"/"+SRC_DIR)    
@@ -123,7 +226,9 @@ def get_configuration_info(proj_name):
     JAVA_LOC = "java" # Java is required to execute SPEEDY
     
     
-    with open(os.path.join(FILE_DIR, 'execute_framac_speedy_config')) as data_file:    
+    # EXECUTE_FRAMAC_SPEEDY_CONFIG environment variable can point to another configuration file
+    config_file = os.environ.get("EXECUTE_FRAMAC_SPEEDY_CONFIG", os.path.join(FILE_DIR, 'execute_framac_speedy_config'))
+    with open(config_file) as data_file:    
         CONFIG_INFO = json.load(data_file)
         if DEBUG:
             print CONFIG_INFO
@@ -143,17 +248,12 @@ def get_configuration_info(proj_name):
        
         if CONFIG_INFO.get("FRAMAC_LOC", "") == "" or CONFIG_INFO.get("SPEEDY_JAR_LOC", "") == "/path/to/framac/executable":
             CONFIG_INFO["FRAMAC_LOC"] = FRAMAC_LOC # setting default value i.e. "frama-c", which assume frama-c is in path
-        else:
-            if not os.path.exists(CONFIG_INFO.get("FRAMAC_LOC", "")):
-                print "ERROR: Frama-c executable doesn't exist at location: " + CONFIG_INFO.get("FRAMAC_LOC", "")
         
         # SPEEDY jar and Java location is needed only when running frama-C via Speedy 
+        # (existence of the executables is checked by the launcher)
         if CONFIG_INFO["USE_SPEEDY"]:
             if CONFIG_INFO.get("SPEEDY_JAR_LOC", "") == "" or CONFIG_INFO.get("SPEEDY_JAR_LOC", "") == "/path/to/SpeedyCore.jar":
                 CONFIG_INFO["SPEEDY_JAR_LOC"] = SPEEDY_JAR_LOC # assuming SpeedyCore.jar is in path
-            else:
-                if not os.path.exists(CONFIG_INFO.get("SPEEDY_JAR_LOC", "")):
-                    print "ERROR: Speedy executable doesn't exist at location: " + CONFIG_INFO.get("SPEEDY_JAR_LOC", "")
             
             if CONFIG_INFO.get("JAVA_HOME", "") == "" or CONFIG_INFO.get("JAVA_HOME", "") == "/path/to/java-home":
                 CONFIG_INFO["JAVA_LOC"] = JAVA_LOC
@@ -161,11 +261,138 @@ def get_configuration_info(proj_name):
                 CONFIG_INFO["JAVA_LOC"] = os.path.join(CONFIG_INFO["JAVA_HOME"], "bin/java")
                 if not os.path.exists(CONFIG_INFO.get("JAVA_LOC", "")):
                     CONFIG_INFO["JAVA_LOC"] = os.path.join(CONFIG_INFO["JAVA_HOME"], "bin/java.exe")
-                    if not os.path.exists(CONFIG_INFO.get("JAVA_LOC", "")):
-                        print "ERROR: Java executable doesn't exist at location: " + CONFIG_INFO.get("JAVA_LOC", "")
+
+        # Incremental mode is only supported when the plugin interprets Frama-C output itself
+        if CONFIG_INFO.get("INCREMENTAL", "") == "" or CONFIG_INFO.get("INCREMENTAL", "") == "No":
+            CONFIG_INFO["INCREMENTAL"] = False
+        elif CONFIG_INFO["USE_SPEEDY"]:
+            print "WARNING: INCREMENTAL option is not supported when executing Frama-C via Speedy, ignoring it"
+            CONFIG_INFO["INCREMENTAL"] = False
+        else:
+            CONFIG_INFO["INCREMENTAL"] = True
+        if CONFIG_INFO.get("INCREMENTAL_DIR", "") == "" or CONFIG_INFO.get("INCREMENTAL_DIR", "") == "/path/to/incremental/dir":
+            # TEMP_DIR is removed at each run, so keep the state next to it
+            CONFIG_INFO["INCREMENTAL_DIR"] = CONFIG_INFO["TEMP_DIR"] + "_incremental"
+        else:
+            CONFIG_INFO["INCREMENTAL_DIR"] = os.path.join(CONFIG_INFO["INCREMENTAL_DIR"], proj_name)
+
+        # Memory limit of the started processes, in MB. 0 means no limit.
+        # CORE_BUDGET is the number of cores shared by the processes and their provers, 0 means all the cores.
+        for option, default in (("PROCESS_MEMORY_CAP_MB", 0), ("CORE_BUDGET", 0)):
+            try:
+                CONFIG_INFO[option] = int(CONFIG_INFO.get(option, default))
+            except (TypeError, ValueError):
+                print "ERROR: " + option + " must be a number of MB. Using " + str(default)
+                CONFIG_INFO[option] = default
+        if CONFIG_INFO.get("JOB_HISTORY_FILE", "") == "" or CONFIG_INFO.get("JOB_HISTORY_FILE", "") == "/path/to/job-history.json":
+            # TEMP_DIR is removed at each run, so keep the history next to it
+            CONFIG_INFO["JOB_HISTORY_FILE"] = CONFIG_INFO["TEMP_DIR"] + "_jobs.json"
+
+        # WP profiles. Without FRAMAC_WP_PROFILES, there is a single unnamed profile using FRAMAC_WP_FLAGS.
+        profiles = CONFIG_INFO.get("FRAMAC_WP_PROFILES", [])
+        if not profiles:
+            profiles = [{"NAME" : None, "FRAMAC_WP_FLAGS" : CONFIG_INFO.get("FRAMAC_WP_FLAGS", [])}]
+        CONFIG_INFO["WP_PROFILES"] = []
+        for i in range(0, len(profiles)):
+            CONFIG_INFO["WP_PROFILES"].append(get_wp_profile(profiles[i], i, [p["NAME"] for p in CONFIG_INFO["WP_PROFILES"]]))
+
+        # What to do with compilation units which don't contain any ACSL annotation
+        action = CONFIG_INFO.get("UNANNOTATED_CU_ACTION", "")
+        if action == "":
+            CONFIG_INFO["UNANNOTATED_CU_ACTION"] = UNANNOTATED_CU_PROVE
+        elif action not in (UNANNOTATED_CU_PROVE, UNANNOTATED_CU_RTE, UNANNOTATED_CU_SKIP):
+            print "ERROR: Unknown UNANNOTATED_CU_ACTION value: " + action + ". Using " + UNANNOTATED_CU_PROVE
+            CONFIG_INFO["UNANNOTATED_CU_ACTION"] = UNANNOTATED_CU_PROVE
+
+        # Stop Frama-C at the first fatal kernel error and continue with the next compilation unit
+        if CONFIG_INFO.get("FAIL_FAST", "") == "" or CONFIG_INFO.get("FAIL_FAST", "") == "No":
+            CONFIG_INFO["FAIL_FAST"] = False
+        else:
+            CONFIG_INFO["FAIL_FAST"] = True
+
+        # Period of the status file updates, 0 to disable them
+        try:
+            CONFIG_INFO["STATUS_INTERVAL_SECONDS"] = float(CONFIG_INFO.get("STATUS_INTERVAL_SECONDS", 10))
+        except (TypeError, ValueError):
+            print "ERROR: STATUS_INTERVAL_SECONDS must be a number of seconds. Using 10"
+            CONFIG_INFO["STATUS_INTERVAL_SECONDS"] = 10.0
     if DEBUG:
         print CONFIG_INFO
      
+def get_fixed_wp_par(wp_flags):
+    tokens = ' '.join(wp_flags).split()
+    for i in range(0, len(tokens)):
+        try:
+            if tokens[i] == "-wp-par" and i+1 < len(tokens):
+                return int(tokens[i+1])
+            elif tokens[i].startswith("-wp-par="):
+                return int(tokens[i][len("-wp-par="):])
+        except ValueError:
+            print "ERROR: Cannot read the number of provers of -wp-par option in FRAMAC_WP_FLAGS"
+    return None
+
+# Returns the profile used by the plugin from a profile of the configuration file.
+# used_names are the names of the profiles already created.
+def get_wp_profile(profile, index, used_names):
+    name = profile.get("NAME", None)
+    if name is None and len(CONFIG_INFO.get("FRAMAC_WP_PROFILES", [])) > 0:
+        name = "profile" + str(index+1)
+    if name is not None:
+        # output files and job history entries are named after the profile
+        if not isinstance(name, basestring) or PROFILE_NAME_PATTERN.match(name) is None:
+            raise Exception('ERROR: Invalid WP profile name: ' + repr(name) + '. Use only letters, digits, "_", "-" and "."')
+        if name in used_names:
+            raise Exception('ERROR: Several WP profiles are named ' + name)
+    wp_flags = profile.get("FRAMAC_WP_FLAGS", [])
+    flags = []
+    if profile.get("WP_RTE", "Yes") != "No":
+        flags.append('-wp-rte')
+    elif CONFIG_INFO["USE_SPEEDY"]:
+        print "WARNING: WP_RTE option of WP profile " + str(name) + " is ignored when executing Frama-C via Speedy"
+
+    # each profile has its own WP output directory. Frama-C runs in TEMP_DIR/src, so the path must be absolute.
+    wp_out = os.path.abspath(CONFIG_INFO["TEMP_DIR"] if name is None else os.path.join(CONFIG_INFO["TEMP_DIR"], "wp_" + name))
+    flags.extend(['-wp', '-wp-print', '-wp-alt-ergo-opt=-backward-compat', '-wp-out', wp_out.replace("\\", "/")])
+    flags.extend(wp_flags)
+    return {
+        "NAME" : name,
+        "WP_FLAGS" : wp_flags,
+        "FLAGS" : flags,
+        "RUN_WP" : True,
+        # WP flags as given to Speedy with -framac-wp-check-args
+        "SPEEDY_WP_ARGS" : launcher.quote_speedy_wp_flags(wp_flags),
+        # -wp-par given by the user is used as is, otherwise it is set for each process by the governor
+        "WP_PAR" : get_fixed_wp_par(wp_flags)
+        }
+
+# Profile used for the RTE-only pass on compilation units without ACSL annotations
+RTE_PROFILE = {"NAME" : None, "WP_FLAGS" : [], "FLAGS" : ['-rte'], "RUN_WP" : False, "SPEEDY_WP_ARGS" : "", "WP_PAR" : 1}
+# Profile used to parse a compilation unit whose state is shared by several WP profiles
+PARSE_PROFILE = {"NAME" : None, "WP_FLAGS" : [], "FLAGS" : [], "RUN_WP" : False, "SPEEDY_WP_ARGS" : "", "WP_PAR" : 1}
+
+# Writes the final status and the job history, and prints the summary of the analysis.
+# Called at exit, unless it was called before, e.g. by the application running the plugin.
+def report_end_of_run():
+    global END_OF_RUN_REPORTED
+    if END_OF_RUN_REPORTED:
+        return
+    END_OF_RUN_REPORTED = True
+    if PROGRESS is not None and CONFIG_INFO["STATUS_INTERVAL_SECONDS"] > 0:
+        try:
+            PROGRESS.stop()
+        except (IOError, OSError) as e:
+            # e.g. TEMP_DIR was removed meanwhile
+            print "WARNING: Cannot write the final status: " + str(e)
+    if SUMMARY is not None:
+        print SUMMARY.report()
+    if GOVERNOR is not None:
+        GOVERNOR.close()
+        try:
+            GOVERNOR.save_history()
+        except (IOError, OSError) as e:
+            print "WARNING: Cannot write the job history: " + str(e)
+        print GOVERNOR.utilization_report()
+
 def isDirectoryWritable(directory):
     if os.path.exists(directory):
         try:
@@ -192,52 +419,153 @@ def execute_framac(cu):
     if CONFIG_INFO["USE_SPEEDY"]:
         return
     if cu.is_user() and cs.language.C == cu.get_language():
-        generate_temp_filesystem(cu.get_sfileinst())
+        sfile_contents = []
+        has_annotations = generate_temp_filesystem(cu.get_sfileinst(), sfile_contents)
         flags = cu.effective_compiler_flags()
         temp_dir = CONFIG_INFO["TEMP_DIR"]
         cu_name = str(cu)
-        framac_loc = CONFIG_INFO["FRAMAC_LOC"]
         # RUN FRAMA-C 
-        working_dir = CONFIG_INFO["TEMP_DIR"]+"/"+ SRC_DIR
-        frama_c_flags = ['-wp-rte', '-wp', '-wp-print', '-wp-alt-ergo-opt=-backward-compat', '-wp-out', temp_dir.replace("\\", "/")]
-        frama_c_flags.extend(CONFIG_INFO["FRAMAC_WP_FLAGS"])
-        framac_cmd = [framac_loc] 
-        cmd = []
-        cmd.extend(framac_cmd)
+        if has_annotations or CONFIG_INFO["UNANNOTATED_CU_ACTION"] == UNANNOTATED_CU_PROVE:
+            profiles = CONFIG_INFO["WP_PROFILES"]
+        elif CONFIG_INFO["UNANNOTATED_CU_ACTION"] == UNANNOTATED_CU_RTE:
+            # Nothing to prove. Only parse the compilation unit and generate RTE annotations,
+            # so that kernel errors and warnings are still reported.
+            print "No ACSL annotation found in compilation unit " + cu_name + ", running RTE-only pass"
+            profiles = [RTE_PROFILE]
+        else:
+            print "No ACSL annotation found in compilation unit " + cu_name + ", skipping it"
+            SUMMARY.record(cu_name, run_summary.SKIPPED)
+            return
+        run_wp = profiles[0]["RUN_WP"]
         flags_string = ' '.join(flags)
         cpp_command = flags_string+ ' -c -C -E -I.'
-        cmd.extend(['-cpp-command', cpp_command.replace("\\", "/")])
-        cmd.extend(frama_c_flags)
-        cmd.append("./"+str(hash(cu.get_sfileinst().get_sfile())) +".c")
-        print "Executing frama-c"
+        cmd = LAUNCHER.framac_command(['-cpp-command', cpp_command.replace("\\", "/")])
+        temp_fs_cu = "./"+str(hash(cu.get_sfileinst().get_sfile())) +".c"
         prod_dict = {}
         for prod in cu.procedures():
             prod_dict[str(prod)] = prod
         
-        outputFileName = os.path.join(temp_dir, os.path.basename(cu_name)+".txt")
-        outputFile = None
-        if DEBUG:
-            print outputFileName
-        outputFile = open(outputFileName, 'w')
-        
-        my_env = os.environ.copy()
+        # In incremental mode, only prove again the procedures affected by the changes since previous run
+        digests = None
+        signature = ' '.join(cmd) + ''.join([' | ' + ' '.join(profile["FLAGS"]) for profile in profiles]) \
+                    + ' | ' + str(LAUNCHER.version("Frama-c"))
+        reused_reports = []
+        wp_fct = []
+        if CONFIG_INFO["INCREMENTAL"] and run_wp:
+            digests = incremental_analysis.compute_digests(sfile_contents, get_call_graph(cu.procedures()))
+            old_state = incremental_analysis.load_state(CONFIG_INFO["INCREMENTAL_DIR"], cu_name)
+            reproved = incremental_analysis.select_procedures(old_state, digests, signature)
+            if reproved is not None:
+                if DEBUG:
+                    print "Procedures to prove again: " + str(sorted(reproved))
+                if len(reproved) == 0:
+                    print "Compilation unit " + cu_name + " is unchanged, using results of previous run"
+                    process_wp_output.replay_codesonar_warnings(
+                        incremental_analysis.from_stored_reports(old_state["reports"], SFILE_KEYS, digests), SFILE_DICT, prod_dict)
+                    SUMMARY.record(cu_name, run_summary.REUSED)
+                    return
+                reused_reports = incremental_analysis.from_stored_reports(
+                    incremental_analysis.reusable_reports(old_state, reproved, digests), SFILE_KEYS, digests)
+                wp_fct = ['-wp-fct', ','.join(sorted(reproved))]
         
-        if not framac_loc == "frama-c":
-            #add frama-c directory in path as generally alt-ergo is placed in same directory.
-            # if alt-ergo is not found in path, Frama-c throws following Error: Alt-Ergo exits with status [127]
-            framac_dir = os.path.dirname(framac_loc)
-            if framac_dir:
-                my_env["PATH"] = str(framac_dir) +  os.pathsep + my_env["PATH"]
+        report_log = []
+        try:
+            if len(profiles) == 1:
+                print "Executing frama-c"
+                report_log.extend(run_framac_job(cu_name, "", cmd + profiles[0]["FLAGS"] + wp_fct + [temp_fs_cu],
+                                                 profiles[0], prod_dict, len(wp_fct) > 0))
+            else:
+                # Parse the compilation unit once, and run WP of each profile from the saved Frama-C state.
+                # Frama-C runs in TEMP_DIR/src, so the path must be absolute.
+                state_file = os.path.abspath(os.path.join(temp_dir, str(hash(cu.get_sfileinst().get_sfile())) + ".sav")).replace("\\", "/")
+                try:
+                    print "Parsing compilation unit with frama-c"
+                    report_log.extend(run_framac_job(cu_name, "parse", cmd + [temp_fs_cu, '-save', state_file],
+                                                     PARSE_PROFILE, prod_dict))
+                    for profile in profiles:
+                        print "Executing frama-c with profile " + profile["NAME"]
+                        report_log.extend(run_framac_job(cu_name, profile["NAME"],
+                                                         LAUNCHER.framac_command(['-load', state_file] + profile["FLAGS"] + wp_fct),
+                                                         profile, prod_dict, len(wp_fct) > 0))
+                finally:
+                    if os.path.exists(state_file):
+                        os.remove(state_file)
+        except process_wp_output.KernelError as e:
+            # Frama-C was stopped at the first fatal error, the other compilation units can still be analysed
+            print "ERROR: Frama-c kernel error on compilation unit " + cu_name + ": " + str(e)
+            SUMMARY.record(cu_name, run_summary.FAILED, str(e))
+            return
+        except Exception as e:
+            SUMMARY.record(cu_name, run_summary.FAILED, str(e))
+            raise
+        if digests is not None:
+            reused_reports = incremental_analysis.remove_reported(reused_reports, report_log)
+            process_wp_output.replay_codesonar_warnings(reused_reports, SFILE_DICT, prod_dict)
+            stored_reports = incremental_analysis.to_stored_reports(reused_reports + report_log, SFILE_DICT,
+                                                                    process_wp_output.process_framac_format_file, digests)
+            incremental_analysis.save_state(CONFIG_INFO["INCREMENTAL_DIR"], cu_name, digests, signature, stored_reports)
+        SUMMARY.record(cu_name, run_summary.ANALYSED)
+
+# Returns the names of the procedures called by each procedure, from codesonar call graph,
+# or None if it is not available
+def get_call_graph(procedures):
+    call_graph = {}
+    try:
+        for prod in procedures:
+            callees = set()
+            for call_site in prod.call_sites():
+                for callee in call_site.callees():
+                    callees.add(str(callee))
+            call_graph[str(prod)] = callees
+    except Exception as e:
+        # e.g. procedure without PDG, callers are then found in procedure bodies
         if DEBUG:
-            print cmd
-            print my_env
-        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=working_dir, env=my_env, shell=False)
-        process_wp_output.parseResultFromOutput(p, outputFile, SFILE_DICT, prod_dict)
-        exitcode = p.wait()
-        if exitcode != 0:
-            raise Exception('ERROR: Failed to run Frama-c analysis on compilation unit ' + cu_name)
-        if outputFile is not None:
-            outputFile.close()
+            print "Cannot obtain call graph: " + str(e)
+        return None
+    return call_graph
+
+# Runs one frama-c process through the governor and interprets its output. Warnings are tagged
+# with the profile name, if any. The job is named after the compilation unit and the suffix, if any.
+# partial is True when only some procedures are proved (-wp-fct).
+# Returns the list of created warnings (see parseResultFromOutput).
+def run_framac_job(cu_name, suffix, cmd, profile, prod_dict, partial=False):
+    temp_dir = CONFIG_INFO["TEMP_DIR"]
+    job_name = cu_name + " [" + suffix + "]" if suffix else cu_name
+    outputFileName = os.path.join(temp_dir, os.path.basename(cu_name) + ("_" + suffix if suffix else "") + ".txt")
+    if DEBUG:
+        print outputFileName
+    outputFile = open(outputFileName, 'w')
+    report_log = []
+    goals = []
+    def launch(cores):
+        job_cmd = list(cmd)
+        if profile["RUN_WP"] and profile["WP_PAR"] is None:
+            job_cmd.extend(['-wp-par', str(cores)])
+        if DEBUG:
+            print job_cmd
+        return LAUNCHER.popen(job_cmd)
+    def consume(p):
+        goals[:] = process_wp_output.parseResultFromOutput(PROGRESS.counted(p), outputFile, SFILE_DICT, prod_dict, report_log,
+                                                           profile["NAME"], CONFIG_INFO["FAIL_FAST"])
+    try:
+        exitcode = GOVERNOR.run(job_name, launch, consume, get_job_cores(profile))
+    finally:
+        outputFile.close()
+    if profile["RUN_WP"] and goals:
+        if not partial:
+            # the goals of some procedures only would make the next full run use too few cores
+            GOVERNOR.record(job_name, "goals", goals[1])
+        PROGRESS.add_goals(goals[0], goals[1])
+    if exitcode != 0:
+        raise Exception('ERROR: Failed to run Frama-c analysis on compilation unit ' + cu_name)
+    return report_log
+
+# Number of cores to reserve for a job, None to let the governor decide
+def get_job_cores(profile):
+    if not profile["RUN_WP"]:
+        # no prover is started
+        return 1
+    return profile["WP_PAR"]
             
 # In order to fix the problem that we don't know the directory in which a compilation unit was built
 # we are making a temporary filesystem. To create this filesystem we are making use of the information 
@@ -246,12 +574,18 @@ def execute_framac(cu):
 # by included sfile_isntances and so on until all the sfiles used by current compilation unit are created.
 # We use sfile's hash code as the name of the sfile when placing them in temp directory and change includes in includer sfiles
 # to point to the created sfiles.      
-def generate_temp_filesystem(sfile_inst):
+# Returns True if any of the created sfiles contains an ACSL annotation.
+# If sfile_contents is a list, the original content of each sfile is appended to it as (sfile, lines).
+def generate_temp_filesystem(sfile_inst, sfile_contents=None):
     sfile_hash_set = set()
-    process_sfile(sfile_hash_set, sfile_inst)
+    process_sfile(sfile_hash_set, sfile_inst, sfile_contents)
     sys.stdout.flush()
+    for sfile_hash in sfile_hash_set:
+        if ANNOTATION_CACHE.get(sfile_hash, False):
+            return True
+    return False
     
-def process_sfile(hash_set, sinst):
+def process_sfile(hash_set, sinst, sfile_contents=None):
     if DEBUG:
         print "processing SFile: "
         print str(sinst)
@@ -268,11 +602,17 @@ def process_sfile(hash_set, sinst):
         hash_set.add(hash(sinst.get_sfile()))
     
     for child in sinst.children_vector():
-        process_sfile(hash_set, child)
+        process_sfile(hash_set, child, sfile_contents)
     
     # read content of the file
     file_content = sinst.read(1, 0, sinst.line_count()+1, 0)
     content_list = file_content.splitlines()
+    
+    sfile_hash = hash(sinst.get_sfile())
+    if sfile_hash not in ANNOTATION_CACHE:
+        ANNOTATION_CACHE[sfile_hash] = ACSL_ANNOTATION_PATTERN.search(file_content) is not None
+    if sfile_contents is not None:
+        sfile_contents.append((sinst.get_sfile(), list(content_list)))
     #print content_list
     
     lines_updated = set()
@@ -354,10 +694,21 @@ def execute_speedy(cu):
         return
         
     if cu.is_user() and cs.language.C == cu.get_language():
-        generate_temp_filesystem(cu.get_sfileinst())
+        has_annotations = generate_temp_filesystem(cu.get_sfileinst())
         flags = cu.effective_compiler_flags()
         cu_name = str(cu)
         
+        run_wp = True
+        if not has_annotations:
+            if CONFIG_INFO["UNANNOTATED_CU_ACTION"] == UNANNOTATED_CU_SKIP:
+                print "No ACSL annotation found in compilation unit " + cu_name + ", skipping it"
+                SUMMARY.record(cu_name, run_summary.SKIPPED)
+                return
+            elif CONFIG_INFO["UNANNOTATED_CU_ACTION"] == UNANNOTATED_CU_RTE:
+                # Speedy syntax and type checking is cheap, only skip the WP part
+                print "No ACSL annotation found in compilation unit " + cu_name + ", running Speedy checks only"
+                run_wp = False
+        
         # Make a dictionary of sfiles and procedures
         #sfile_dict = {}
         prod_dict = {}
@@ -375,60 +726,95 @@ def execute_speedy(cu):
         #        It might be better to add an option to pass complete -cpp-command to speedy.
         cpp_command = '\"'+' '.join(flags[1:])+ ' -c\"'
         temp_fs_cu = "./"+str(hash(cu.get_sfileinst().get_sfile())) +".c"
-        wp_flag = ""
-        for s in CONFIG_INFO["FRAMAC_WP_FLAGS"]:
-            if " " in s.strip():
-                wp_flag = wp_flag + " " + "\'" + s.strip() + "\'"
-            else:
-                wp_flag = wp_flag + " " + s.strip()                
-        wp_flag = wp_flag.strip()
         
-        speedy_cmd = [CONFIG_INFO["JAVA_LOC"].replace("\\", "/"), '-jar', CONFIG_INFO["SPEEDY_JAR_LOC"].replace("\\", "/"),
-                      '-check', '-framac-wp', '-cppflags', cpp_command, '-output', CONFIG_INFO["TEMP_DIR"]]
-        if wp_flag:
-            speedy_cmd.extend(['-framac-wp-check-args', "\""+ wp_flag.replace("\"", "'")+"\""])
-        
-        speedy_cmd.append(temp_fs_cu)
-        outputFileName = os.path.join(CONFIG_INFO["TEMP_DIR"], os.path.basename(cu_name)+"_framac.txt")
-        outputFile = None
+        # Speedy parses the compilation unit itself, so it is executed once per WP profile
+        profiles = CONFIG_INFO["WP_PROFILES"] if run_wp else [RTE_PROFILE]
+        try:
+            for profile in profiles:
+                if profile["NAME"] is not None:
+                    print "Executing speedy with profile " + profile["NAME"]
+                run_speedy_job(cu_name, cpp_command, temp_fs_cu, profile, prod_dict)
+        except process_wp_output.KernelError as e:
+            # Speedy was stopped at the first fatal error, the other compilation units can still be analysed
+            print "ERROR: Frama-c kernel error on compilation unit " + cu_name + ": " + str(e)
+            SUMMARY.record(cu_name, run_summary.FAILED, str(e))
+            return
+        except Exception as e:
+            SUMMARY.record(cu_name, run_summary.FAILED, str(e))
+            raise
+        SUMMARY.record(cu_name, run_summary.ANALYSED)
+
+# Runs speedy once through the governor and interprets its output. Warnings are tagged with the profile name, if any.
+def run_speedy_job(cu_name, cpp_command, temp_fs_cu, profile, prod_dict):
+    run_wp = profile["RUN_WP"]
+    suffix = "_" + profile["NAME"] if profile["NAME"] is not None else ""
+    job_name = cu_name + " [" + profile["NAME"] + "]" if profile["NAME"] is not None else cu_name
+    outputFileName = os.path.join(CONFIG_INFO["TEMP_DIR"], os.path.basename(cu_name)+suffix+"_framac.txt")
+    outputFile = None
+    if DEBUG:
+        print outputFileName
+        outputFile = open(outputFileName, 'w')
+    
+    # TODO: makefile or build command can have code to change directory and then build the project. frama-c or speedy should be
+    # executed in the same directory in which project was build as compiler flags are set with respect to that directory. 
+    # Is there are way to obtain build directory from codesonar to set cwd?
+    goals = []
+    def launch(cores):
+        wp_args = profile["SPEEDY_WP_ARGS"]
+        if run_wp and profile["WP_PAR"] is None:
+            wp_args = (wp_args + " -wp-par " + str(cores)).strip()
+        cmd = LAUNCHER.speedy_command(cpp_command, run_wp, wp_args, temp_fs_cu)
         if DEBUG:
-            print outputFileName
-            print speedy_cmd
-            outputFile = open(outputFileName, 'w')
-        
-        # TODO: makefile or build command can have code to change directory and then build the project. frama-c or speedy should be
-        # executed in the same directory in which project was build as compiler flags are set with respect to that directory. 
-        # Is there are way to obtain build directory from codesonar to set cwd?
-        working_dir = CONFIG_INFO["TEMP_DIR"]+"/"+ SRC_DIR        
-        p = subprocess.Popen(speedy_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=working_dir, shell=False)
-        process_speedy_output(p, outputFile, SFILE_DICT, prod_dict)
-        exitcode = p.wait()
-        if exitcode == 1:
-            raise Exception('ERROR: SPEEDY cannot parse the command-line arguments successfully while analysing compilation unit ' + cu_name)
-        elif exitcode == 3:
-            raise Exception('ERROR: Failed to run Frama-c analysis on compilation unit ' + cu_name) 
-        elif exitcode == 4:
-            raise Exception('ERROR: SPEEDY internal exception occurred while analysing compilation unit '+ cu_name)
-        elif exitcode != 0 and exitcode != 2:
-            raise Exception('Unexpected error occurred while executing speedy on compilation unit '+ cu_name)
-            
+            print cmd
+        return LAUNCHER.popen(cmd)
+    def consume(p):
+        goals[:] = process_speedy_output(PROGRESS.counted(p), outputFile, SFILE_DICT, prod_dict, profile["NAME"],
+                                         CONFIG_INFO["FAIL_FAST"])
+    try:
+        exitcode = GOVERNOR.run(job_name, launch, consume, get_job_cores(profile))
+    finally:
         if outputFile is not None:
             outputFile.close()
+    if run_wp and goals:
+        GOVERNOR.record(job_name, "goals", goals[1])
+        PROGRESS.add_goals(goals[0], goals[1])
+    if exitcode == 1:
+        raise Exception('ERROR: SPEEDY cannot parse the command-line arguments successfully while analysing compilation unit ' + cu_name)
+    elif exitcode == 3:
+        raise Exception('ERROR: Failed to run Frama-c analysis on compilation unit ' + cu_name) 
+    elif exitcode == 4:
+        raise Exception('ERROR: SPEEDY internal exception occurred while analysing compilation unit '+ cu_name)
+    elif exitcode != 0 and exitcode != 2:
+        raise Exception('Unexpected error occurred while executing speedy on compilation unit '+ cu_name)
         
-def process_speedy_output(process, output_file, sfile_dict, prod_dict):
+# Returns the number of satisfied goals and the number of goal results found in the output.
+# If tag is given, messages are prefixed with it.
+# If fail_fast is True, process_wp_output.KernelError is raised as soon as a fatal kernel error is read.
+def process_speedy_output(process, output_file, sfile_dict, prod_dict, tag=None, fail_fast=False):
+    proved = 0
+    goals = 0
     while True:
         line = process.stdout.readline()
         if line == "":
             break
         if output_file is not None:
             output_file.write(line)
-        success = process_commandLine_goal_output(sfile_dict, prod_dict, line)
+        data = line.split('(FramacWp)')
+        if len(data) == 2:
+            goals = goals + 1
+            results = data[1].strip().split(':')
+            if len(results) == 2 and results[1].strip().startswith('Satisfied'):
+                proved = proved + 1
+        success = process_commandLine_goal_output(sfile_dict, prod_dict, line, tag)
         if not success:
-            success = process_commandline_problemlistener_output(sfile_dict, prod_dict, line)
+            success = process_commandline_problemlistener_output(sfile_dict, prod_dict, line, tag)
             if not success and DEBUG:                
                 print "Cannot parse line: " + line + " of the output"
+            if fail_fast and process_wp_output.KERNEL_FATAL_ERROR.search(line) is not None:
+                raise process_wp_output.KernelError(line.strip())
+    return proved, goals
 
-def process_commandLine_goal_output(sfile_dict, prod_dict, output):
+def process_commandLine_goal_output(sfile_dict, prod_dict, output, tag=None):
     data = output.split('(FramacWp)')
     if len(data) == 2:
         results = data[1].strip().split(':')
@@ -440,25 +826,15 @@ def process_commandLine_goal_output(sfile_dict, prod_dict, output):
         else:
             file, line = obtain_file_line_info(data[0])
             if file is not None and line is not None:
-                if file in sfile_dict:
-                    sf = sfile_dict[file]
+                file = process_wp_output.find_sfile_key(file, sfile_dict)
+                if file is not None:
                     function_name = ""
                     if len(results[0]) >= len("result for goal for function"): 
                         function_name = results[0][len("result for goal for function"):].strip()
-                        
-                    procedures = sf.procedures_on_line(int(line))
-                    if procedures is not None and len(procedures) > 0:
-                        procedure = procedures[0]
-                    else:
-                        # If the specification is not inside a function definition, in that case procedures will be empty
-                        # If it is too bad to create a dictionary of procedures and use it this way, we can leave procedure empty?
-                        # This procedure may be defined in a different file, but it seems that for adding warning and filling procedure column it doesn't matter.
-                        procedure = prod_dict.get(function_name, None)
-                    
-                    if procedure:
-                        process_wp_output.spec_violation_wc.report(sf.arbitrary_instance(), int(line), procedure, data[1])
-                    else:            
-                        process_wp_output.spec_violation_wc.report(sf.arbitrary_instance(), int(line), data[1])
+                    # The procedure is the one on the line, or the function of the goal if the specification
+                    # is not inside a function definition
+                    process_wp_output.create_codesonar_warning(function_name, file, int(line), data[1], sfile_dict, prod_dict,
+                                                               process_wp_output.spec_violation_wc, tag=tag)
                 return True
             else:
                 return False
@@ -474,7 +850,7 @@ def obtain_file_line_info(info):
     else:
         return None, None
     
-def process_commandline_problemlistener_output(sfile_dict, prod_dict, line):
+def process_commandline_problemlistener_output(sfile_dict, prod_dict, line, tag=None):
     warning_class = process_wp_output.spec_warning_wc
     match = SPEEDY_PROBLEMLISTENER_WARNING_PATTERN.search(line)
     if match is None:
@@ -486,14 +862,11 @@ def process_commandline_problemlistener_output(sfile_dict, prod_dict, line):
         file_info = match.group(1)
         file, line = obtain_file_line_info(file_info)
         if file is not None and line is not None:
-            if file in sfile_dict:
-                sf = sfile_dict[file]
-                # Obtain procedure from line number and sfile. 
-                procedures = sf.procedures_on_line(int(line))
-                if procedures is not None and len(procedures) > 0:
-                    warning_class.report(sf.arbitrary_instance(), int(line), procedures[0], error)
-                else:                            
-                    warning_class.report(sf.arbitrary_instance(), int(line), error)
+            file = process_wp_output.find_sfile_key(file, sfile_dict)
+            if file is not None:
+                # Procedure is obtained from line number and sfile.
+                process_wp_output.create_codesonar_warning(None, file, int(line), error, sfile_dict, prod_dict,
+                                                           warning_class, tag=tag)
                 return True
             else: 
                 return False
@@ -506,14 +879,10 @@ def process_commandline_problemlistener_output(sfile_dict, prod_dict, line):
             line = match.group(2)
             error = match.group(5)
             if file is not None and line is not None and error is not None:
-                if file in sfile_dict:
-                    sf = sfile_dict[file]
-                    procedures = sf.procedures_on_line(int(line))
-
-                    if procedures is not None and len(procedures) > 0:
-                        process_wp_output.speedy_error_wc.report(sf.arbitrary_instance(), int(line), procedures[0], error)
-                    else:                            
-                        process_wp_output.speedy_error_wc.report(sf.arbitrary_instance(), int(line), error)
+                file = process_wp_output.find_sfile_key(file, sfile_dict)
+                if file is not None:
+                    process_wp_output.create_codesonar_warning(None, file, int(line), error, sfile_dict, prod_dict,
+                                                               process_wp_output.speedy_error_wc, tag=tag)
                     return True
                 else: 
                     return False
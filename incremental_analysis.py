@@ -0,0 +1,283 @@
+# Change-impact analysis used by the incremental mode of execute_framac_speedy plugin.
+#
+# For each compilation unit we store, between two runs, a content digest of each procedure
+# body, a digest of the ACSL contract written just before each procedure definition and a
+# digest of everything else (types, globals, declarations, contracts in headers, ...).
+# We also store the codesonar warnings created for the compilation unit.
+#
+# On the next run, if only procedure bodies or contracts changed, only the changed procedures
+# and the callers of the procedures whose contract changed have to be proved again. Warnings
+# of the other procedures are taken from the stored results. Any other change (or a change
+# of the Frama-C command line) makes the whole compilation unit to be proved again.
+#
+# A goal belongs to the function WP proved it with, e.g. the pre-condition of a call belongs
+# to the caller, although its location is the contract of the callee. A WP warning belongs to
+# the procedure it is located in. Kernel warnings and errors are always reported again, as
+# the kernel parses the whole compilation unit.
+#
+# Procedures may move when the lines before them change, so warnings inside a procedure or its
+# contract are stored with their offset from the first line of the procedure, and are moved
+# with it on the next run. Lines between two procedures are hashed, and their warnings stored,
+# with their offset from the end of the previous procedure: a procedure body growing or
+# shrinking doesn't change them. Only lines before the first procedure of a file keep their
+# line number, so adding a line before them makes the whole compilation unit to be proved again.
+#
+# Procedures are found using codesonar procedures on each line of the sfiles. Callers are
+# found with the codesonar call graph. When it is not available, they are found by looking for
+# the name of the procedure in the body of the other procedures, which may select few more
+# callers than needed but never less.
+
+import os
+import re
+import json
+import hashlib
+import json_file
+
+ACSL_BLOCK_START = re.compile(r'/\*@|//@')
+ACSL_BLOCK_END = re.compile(r'\*/')
+IDENTIFIER = re.compile(r'[A-Za-z_]\w*')
+
+STATE_VERSION = 3
+
+
+class CompUnitDigests:
+    """ Class to store content digests of a compilation unit """
+
+    def __init__(self):
+        self.globalDigest = hashlib.md5()
+        self.bodyDigests = {}
+        self.contractDigests = {}
+        self.bodyIdentifiers = {}
+        # procedure name -> set of called procedure names, None if the call graph is not known
+        self.callGraph = None
+        # procedure name -> [file, first line of its contract or body, first line of its body, last line]
+        self.spans = {}
+
+    def add_global(self, lines, first_line, previous=None, previous_end=0):
+        """ Adds lines outside of procedures, previous being the procedure ending on line previous_end before them """
+        for i in range(0, len(lines)):
+            self.globalDigest.update("%s+%d:%s\n" % (previous or "", first_line + i - previous_end, lines[i].strip()))
+
+    def add_body(self, procedure, file, line_number, line):
+        self.bodyDigests.setdefault(procedure, hashlib.md5()).update(line.strip() + "\n")
+        self.bodyIdentifiers.setdefault(procedure, set()).update(IDENTIFIER.findall(line))
+        span = self.spans.setdefault(procedure, [file, line_number, None, None])
+        if span[0] == file:
+            if span[2] is None:
+                span[2] = line_number
+            span[3] = line_number
+
+    def add_contract(self, procedure, file, first_line, lines):
+        digest = self.contractDigests.setdefault(procedure, hashlib.md5())
+        for line in lines:
+            digest.update(line.strip() + "\n")
+        if procedure not in self.spans:
+            self.spans[procedure] = [file, first_line, None, None]
+
+    def procedures(self):
+        return set(self.bodyDigests.keys())
+
+    def callees(self, procedure):
+        if self.callGraph is not None:
+            return self.callGraph.get(procedure, set())
+        return self.bodyIdentifiers.get(procedure, set())
+
+    def procedure_at(self, file, line):
+        """ Returns the name of the procedure whose body or contract contains the line, None if there is none """
+        for name, (span_file, first, body, last) in self.spans.items():
+            if span_file == file and first <= line <= last:
+                return name
+        return None
+
+    def anchor(self, file, line):
+        """ Returns [procedure, offset from its first body line] for a line of a procedure or its contract,
+            [procedure, offset from its last line, "after"] for a line after a procedure, None otherwise """
+        name = self.procedure_at(file, line)
+        if name is not None:
+            return [name, line - self.spans[name][2]]
+        previous = None
+        for name, (span_file, first, body, last) in self.spans.items():
+            if span_file == file and last is not None and last < line:
+                if previous is None or last > self.spans[previous][3]:
+                    previous = name
+        if previous is None:
+            return None
+        return [previous, line - self.spans[previous][3], "after"]
+
+    def rebase(self, file, anchor):
+        """ Returns the current line of an anchor given by anchor(), None if the procedure is not in the file anymore """
+        name, offset = anchor[0], anchor[1]
+        span = self.spans.get(name, None)
+        if span is None or span[0] != file:
+            return None
+        if len(anchor) > 2:
+            return span[3] + offset
+        return span[2] + offset
+
+    def to_state(self):
+        procedures = {}
+        for name in self.procedures():
+            contract = self.contractDigests[name].hexdigest() if name in self.contractDigests else ""
+            procedures[name] = [self.bodyDigests[name].hexdigest(), contract]
+        return {"global": self.globalDigest.hexdigest(), "procedures": procedures}
+
+    def __repr__(self):
+        return 'CompUnitDigests(global=%s, procedures=%s)' % (self.globalDigest.hexdigest(), sorted(self.procedures()))
+
+
+# sfile_contents is a list of (sfile, lines) pairs with the original content of every
+# sfile of the compilation unit, as collected by generate_temp_filesystem.
+# call_graph maps each procedure name to the names of the procedures it calls, if known.
+def compute_digests(sfile_contents, call_graph=None):
+    digests = CompUnitDigests()
+    digests.callGraph = call_graph
+    for sf, lines in sorted(sfile_contents, key=lambda pair: str(pair[0])):
+        # name the file so that moving code between files is seen as a change
+        digests.add_global(["// file " + str(sf)], 0)
+        pending_contract = []
+        pending_contract_line = 0
+        in_contract = False
+        # procedure before the current line, and its last line
+        previous = None
+        previous_end = 0
+        for i in range(0, len(lines)):
+            line = lines[i]
+            procedures = sf.procedures_on_line(i+1)
+            if procedures is not None and len(procedures) > 0:
+                name = str(procedures[0])
+                # an annotation block followed by the procedure is the contract of the procedure
+                if pending_contract:
+                    digests.add_contract(name, str(sf), pending_contract_line, pending_contract)
+                    pending_contract = []
+                    in_contract = False
+                digests.add_body(name, str(sf), i+1, line)
+                previous = name
+                previous_end = i+1
+            elif in_contract or ACSL_BLOCK_START.search(line) is not None:
+                if not pending_contract:
+                    pending_contract_line = i+1
+                pending_contract.append(line)
+                if in_contract:
+                    in_contract = ACSL_BLOCK_END.search(line) is None
+                else:
+                    start = ACSL_BLOCK_START.search(line)
+                    in_contract = start.group(0) == "/*@" and ACSL_BLOCK_END.search(line, start.end()) is None
+            elif line.strip() == "":
+                continue
+            else:
+                # annotation block not followed by a procedure definition, e.g. contract of a declaration
+                digests.add_global(pending_contract, pending_contract_line, previous, previous_end)
+                digests.add_global([line], i+1, previous, previous_end)
+                pending_contract = []
+                in_contract = False
+        digests.add_global(pending_contract, pending_contract_line, previous, previous_end)
+    return digests
+
+# Returns the set of procedures which must be proved again, or None if the whole
+# compilation unit must be proved again.
+def select_procedures(old_state, digests, signature):
+    if old_state is None:
+        return None
+    if old_state.get("version") != STATE_VERSION or old_state.get("signature") != signature:
+        return None
+    new_state = digests.to_state()
+    if old_state.get("global") != new_state["global"]:
+        return None
+
+    old_procedures = old_state.get("procedures", {})
+    new_procedures = new_state["procedures"]
+    changed = set()
+    changed_contracts = set()
+    for name in set(old_procedures.keys()) | set(new_procedures.keys()):
+        if name not in old_procedures or name not in new_procedures:
+            changed.add(name)
+            changed_contracts.add(name)
+            continue
+        old_body, old_contract = old_procedures[name]
+        new_body, new_contract = new_procedures[name]
+        if old_body != new_body:
+            changed.add(name)
+        if old_contract != new_contract:
+            changed.add(name)
+            changed_contracts.add(name)
+
+    # callers use the contract of their callees
+    for name in new_procedures:
+        if digests.callees(name) & changed_contracts:
+            changed.add(name)
+
+    # deleted procedures can't be proved
+    return changed & set(new_procedures.keys())
+
+# Returns the stored warnings which are still valid when only the given procedures are proved again,
+# i.e. the warnings of WP for the other procedures. Warnings of WP which don't belong to any procedure
+# are kept too, see remove_reported.
+def reusable_reports(old_state, reproved_procedures, digests):
+    procedures = digests.procedures()
+    reports = []
+    for report in old_state.get("reports", []):
+        wp_function = report[6]
+        if wp_function is None:
+            # kernel warnings and errors are reported again
+            continue
+        if wp_function == "" or (wp_function in procedures and wp_function not in reproved_procedures):
+            reports.append(report)
+    return reports
+
+# Returns the reused warnings which were not reported again by the new run
+def remove_reported(reused_reports, reports):
+    reported = set([(class_name, file, line, msg) for class_name, function, file, line, msg, wp_function in reports])
+    return [report for report in reused_reports if (report[0], report[2], report[3], report[4]) not in reported]
+
+# Files of the warnings are named after the temporary filesystem, and these names change between
+# two analyses. Warnings are stored with the path of the sfile instead, and with their position
+# in their procedure, if any (see CompUnitDigests.anchor). WP warnings are stored with the name of
+# the procedure they belong to.
+# file_key gives the key of sfile_dict for a file name found in Frama-C output.
+def to_stored_reports(reports, sfile_dict, file_key, digests):
+    stored = []
+    for class_name, function, file, line, msg, wp_function in reports:
+        sf = sfile_dict.get(file_key(file), None)
+        path = str(sf) if sf is not None else file
+        if wp_function == "":
+            wp_function = digests.procedure_at(path, line) or ""
+        stored.append([class_name, function, path, line, msg, digests.anchor(path, line), wp_function])
+    return stored
+
+# Returns the stored warnings as created by parseResultFromOutput, at their line in the current
+# content of the compilation unit given by digests.
+# sfile_keys maps the path of each sfile to its key in the sfile dictionary of current analysis
+def from_stored_reports(reports, sfile_keys, digests):
+    current = []
+    for class_name, function, file, line, msg, anchor, wp_function in reports:
+        if anchor is not None:
+            line = digests.rebase(file, anchor)
+            if line is None:
+                continue
+        current.append([class_name, function, sfile_keys.get(file, file), line, msg, wp_function])
+    return current
+
+def state_file(state_dir, cu_name):
+    return os.path.join(state_dir, hashlib.md5(cu_name).hexdigest() + ".json")
+
+def load_state(state_dir, cu_name):
+    path = state_file(state_dir, cu_name)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as data_file:
+            return json.load(data_file)
+    except ValueError:
+        # a previous run was interrupted while writing the state
+        print("WARNING: Ignoring corrupted incremental state file %s" % (path))
+        return None
+
+def save_state(state_dir, cu_name, digests, signature, reports):
+    if not os.path.exists(state_dir):
+        os.makedirs(state_dir)
+    state = digests.to_state()
+    state["version"] = STATE_VERSION
+    state["compunit"] = cu_name
+    state["signature"] = signature
+    state["reports"] = reports
+    json_file.write_json(state_file(state_dir, cu_name), state)
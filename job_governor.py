@@ -0,0 +1,283 @@
+# Memory control of the Frama-C and Speedy processes started by execute_framac_speedy plugin.
+#
+# Codesonar visits the compilation units one after the other, so the governor runs one job at
+# a time. WP and the provers it starts can use many gigabytes on some compilation units. While
+# a job runs, the resident set size of the process and all its children (the provers) is
+# sampled, and a job using more than the per-process cap is killed, so that it can't take the
+# memory needed by the codesonar analysis itself. Peak memory of each job is kept in a history
+# file, to find the compilation units which need the most memory. The history is kept in memory
+# and written every minute and at the end of the analysis.
+#
+# Resident set size is read from /proc, so on platforms without it jobs are never killed.
+#
+# The governor also gives each job a number of cores for the provers it starts: as many as the
+# job had goals to prove on the previous run (known from the history), within the core budget.
+# A compilation unit with a few goals is then not counted as using the whole budget, which
+# keeps the utilization report meaningful. The granted number is given to WP with -wp-par.
+
+import os
+import json
+import time
+import signal
+import threading
+import multiprocessing
+import json_file
+
+SAMPLING_INTERVAL = 0.5 # seconds
+HISTORY_SAVE_INTERVAL = 60 # seconds
+MB = 1024 * 1024
+
+if hasattr(os, "sysconf") and "SC_PAGE_SIZE" in os.sysconf_names:
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+else:
+    PAGE_SIZE = 4096
+
+def process_tree(pid):
+    """ Returns the pids of the process and all its descendants, None if /proc is not available """
+    if not os.path.isdir("/proc"):
+        return None
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/" + entry + "/stat") as stat_file:
+                stat = stat_file.read()
+        except (IOError, OSError):
+            # process exited meanwhile
+            continue
+        # command name is between parentheses and may contain spaces
+        fields = stat[stat.rfind(")")+2:].split()
+        children.setdefault(int(fields[1]), []).append(int(entry))
+    pids = []
+    todo = [pid]
+    while todo:
+        current = todo.pop()
+        pids.append(current)
+        todo.extend(children.get(current, []))
+    return pids
+
+def process_tree_rss(pid):
+    """ Returns the resident set size in bytes of the process and all its descendants, None if it can't be measured """
+    pids = process_tree(pid)
+    if pids is None:
+        return None
+    total = 0
+    for current in pids:
+        try:
+            with open("/proc/" + str(current) + "/statm") as statm_file:
+                total = total + int(statm_file.read().split()[1]) * PAGE_SIZE
+        except (IOError, OSError):
+            continue
+    return total
+
+def kill_process_tree(process):
+    pids = process_tree(process.pid)
+    if pids is None:
+        process.kill()
+        return
+    # kill the children first, so that they are not re-parented and left running
+    for pid in reversed(pids):
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            continue
+
+
+class MemoryMonitor(threading.Thread):
+    """ Thread sampling the memory of a running job and killing it when it goes over its cap """
+
+    def __init__(self, process, capMB):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.process = process
+        self.capMB = capMB
+        self.peakMB = 0
+        self.killed = False
+        self.stopped = threading.Event()
+        # held while sampling, so that the process is never sampled nor killed once stopped
+        self.lock = threading.Lock()
+
+    def run(self):
+        while not self.stopped.wait(SAMPLING_INTERVAL):
+            self.lock.acquire()
+            try:
+                if self.stopped.is_set():
+                    return
+                rss = process_tree_rss(self.process.pid)
+                if rss is None:
+                    return
+                rss_mb = rss // MB
+                self.peakMB = max(self.peakMB, rss_mb)
+                if self.capMB > 0 and rss_mb > self.capMB:
+                    self.killed = True
+                    kill_process_tree(self.process)
+                    return
+            finally:
+                self.lock.release()
+
+    def stop(self):
+        """ Stops the sampling. Doesn't wait for the thread, whose wait can take a while on Python 2. """
+        self.lock.acquire()
+        try:
+            self.stopped.set()
+        finally:
+            self.lock.release()
+
+
+class JobGovernor:
+    """ Class to run jobs under a memory cap, share the cores between them and record their peak memory """
+
+    def __init__(self, processCapMB, historyFile, coreBudget=0):
+        self.processCapMB = processCapMB
+        self.historyFile = historyFile
+        self.coreBudget = coreBudget if coreBudget > 0 else multiprocessing.cpu_count()
+        self.history = {}
+        self.historyChanged = False
+        self.lastHistorySave = time.time()
+        self.reservedCores = {}
+        self.jobNames = {}
+        self.nextJobId = 0
+        # stopped memory monitors whose thread may still be running, see close()
+        self.monitors = []
+        # the progress thread reads the running jobs
+        self.lock = threading.RLock()
+        # used to report core utilization
+        self.startCpuTime = self.children_cpu_time()
+        self.firstJobStart = None
+        self.lastJobEnd = None
+        self.grantedCoreSeconds = 0.0
+        if historyFile and os.path.exists(historyFile):
+            try:
+                with open(historyFile) as data_file:
+                    self.history = json.load(data_file)
+            except ValueError:
+                print("WARNING: Ignoring corrupted job history file %s" % (historyFile))
+
+    def __repr__(self):
+        return 'JobGovernor(process-cap=%d MB, core-budget=%d, running=%d)' \
+            % (self.processCapMB, self.coreBudget, len(self.reservedCores))
+
+    def estimate_cores(self, job_name):
+        """ Number of cores the job can use, i.e. its number of goals when known """
+        goals = self.history.get(job_name, {}).get("goals", None)
+        if goals is None:
+            return self.coreBudget
+        return max(1, min(goals, self.coreBudget))
+
+    def run(self, job_name, launch, consume, cores=None):
+        """ Starts the job with launch(cores), which returns a subprocess.Popen, and reads its output
+            with consume(process). If cores is given, the job always uses that many cores, otherwise
+            launch receives the number of cores granted to the job. Returns the exit code of the process. """
+        wanted = cores if cores is not None else self.estimate_cores(job_name)
+        job_id, granted = self.admit(wanted, cores is not None, job_name)
+        monitor = None
+        try:
+            process = launch(granted)
+            monitor = MemoryMonitor(process, self.processCapMB)
+            monitor.start()
+            try:
+                consume(process)
+            except Exception:
+                monitor.stop()
+                # output of a killed job is incomplete
+                if not monitor.killed:
+                    # e.g. a fatal error found in the output, the rest of the job is useless
+                    kill_process_tree(process)
+                    process.wait()
+                    raise
+            # the pid of the process may be reused once it is waited for
+            monitor.stop()
+            exitcode = process.wait()
+        finally:
+            if monitor is not None:
+                monitor.stop()
+                self.monitors = [m for m in self.monitors if m.is_alive()] + [monitor]
+            self.release(job_id)
+
+        if monitor.peakMB > 0:
+            self.record(job_name, "peak_mb", monitor.peakMB)
+        if monitor.killed:
+            raise Exception('ERROR: %s exceeded its memory cap of %d MB' % (job_name, self.processCapMB))
+        return exitcode
+
+    def admit(self, wantedCores, fixedCores, job_name=None):
+        self.lock.acquire()
+        try:
+            job_id = self.nextJobId
+            self.nextJobId = self.nextJobId + 1
+            if fixedCores:
+                granted = wantedCores
+            else:
+                granted = max(1, min(wantedCores, self.coreBudget))
+            self.reservedCores[job_id] = (granted, time.time())
+            self.jobNames[job_id] = job_name
+            if self.firstJobStart is None:
+                self.firstJobStart = time.time()
+            return job_id, granted
+        finally:
+            self.lock.release()
+
+    def release(self, job_id):
+        self.lock.acquire()
+        try:
+            cores, start = self.reservedCores.pop(job_id)
+            del self.jobNames[job_id]
+            self.lastJobEnd = time.time()
+            self.grantedCoreSeconds = self.grantedCoreSeconds + cores * (self.lastJobEnd - start)
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """ Waits for the threads of the stopped memory monitors, which would fail if still running at exit """
+        for monitor in self.monitors:
+            monitor.join()
+        self.monitors = []
+
+    def running_jobs(self):
+        """ Returns the name, granted cores and running time in seconds of each running job """
+        self.lock.acquire()
+        try:
+            now = time.time()
+            return [(self.jobNames[job_id], cores, now - start)
+                    for job_id, (cores, start) in sorted(self.reservedCores.items())]
+        finally:
+            self.lock.release()
+
+    def children_cpu_time(self):
+        # CPU time of the terminated children, including the provers they waited for.
+        # Always 0 on Windows.
+        times = os.times()
+        return times[2] + times[3]
+
+    def utilization_report(self):
+        """ Returns a message about how the core budget was used by the jobs run so far """
+        if self.firstJobStart is None or self.lastJobEnd is None:
+            return "Core utilization: no job was run"
+        elapsed = max(self.lastJobEnd - self.firstJobStart, 0.001)
+        cpu_time = self.children_cpu_time() - self.startCpuTime
+        available = self.coreBudget * elapsed
+        return "Core utilization: %.1f CPU seconds used out of %.1f available (%d cores during %.1f seconds): %.1f%% used, %.1f%% granted" \
+            % (cpu_time, available, self.coreBudget, elapsed, 100.0 * cpu_time / available, 100.0 * self.grantedCoreSeconds / available)
+
+    def record(self, job_name, key, value):
+        self.lock.acquire()
+        try:
+            self.history.setdefault(job_name, {})[key] = value
+            self.historyChanged = True
+            # writing the whole history after each job would be quadratic in the number of jobs
+            if time.time() - self.lastHistorySave >= HISTORY_SAVE_INTERVAL:
+                self.save_history()
+        finally:
+            self.lock.release()
+
+    def save_history(self):
+        """ Writes the history file, if the history changed since it was last written """
+        self.lock.acquire()
+        try:
+            if self.historyFile and self.historyChanged:
+                json_file.write_json(self.historyFile, self.history)
+            self.historyChanged = False
+            self.lastHistorySave = time.time()
+        finally:
+            self.lock.release()
@@ -0,0 +1,15 @@
+# Writing of the JSON files kept by execute_framac_speedy plugin (incremental state, job history,
+# run summary and status). Files are written to a temporary file first and renamed, so that a
+# reader, or the next run after an interruption, never sees a partially written file.
+
+import os
+import sys
+import json
+
+def write_json(path, data, indent=None):
+    with open(path + ".tmp", 'w') as data_file:
+        json.dump(data, data_file, indent=indent)
+    if sys.platform == "win32" and os.path.exists(path):
+        # rename doesn't replace an existing file on Windows, elsewhere it does so atomically
+        os.remove(path)
+    os.rename(path + ".tmp", path)
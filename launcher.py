@@ -0,0 +1,137 @@
+# Launch template of the Frama-C and Speedy processes started by execute_framac_speedy plugin.
+#
+# Everything which is the same for all the processes of an analysis is computed once, when the
+# plugin is set up: location of the executables (Frama-C, Alt-Ergo, Java and SpeedyCore.jar),
+# versions of the tools, environment of the processes and the fixed part of their command lines.
+# A missing Frama-C, Java or SpeedyCore.jar stops the analysis at once, instead of making every
+# compilation unit fail. A missing Alt-Ergo only prints a warning, as WP may use other provers.
+# Each job then only adds the arguments of its compilation unit.
+#
+# The template is shared by all the jobs, so it is read-only once created: its attributes can't
+# be set, command lines are returned as new lists and each process gets its own copy of the
+# environment.
+
+import os
+import subprocess
+
+try:
+    from shutil import which as find_executable
+except ImportError:
+    # Python 2
+    from distutils.spawn import find_executable
+
+
+class LaunchTemplate:
+    """ Class to store what is common to the Frama-C or Speedy processes of an analysis """
+
+    def __init__(self, framacLoc, javaLoc, speedyJarLoc, useSpeedy, workingDir, outputDir):
+        self.frozen = False
+        self.useSpeedy = useSpeedy
+        self.workingDir = workingDir
+        self.outputDir = outputDir
+        self.env = os.environ.copy()
+        self.versions = {}
+        if useSpeedy:
+            # Speedy finds Frama-C itself
+            self.framacLoc = None
+            self.javaLoc = resolve_executable(javaLoc, "Java")
+            self.speedyJarLoc = resolve_file(speedyJarLoc, "Speedy")
+            self.versions["Java"] = tool_version([self.javaLoc, '-version'], self.env)
+            self.framacCommand = None
+            self.speedyCommand = (self.javaLoc, '-jar', self.speedyJarLoc, '-check')
+        else:
+            self.framacLoc = resolve_executable(framacLoc, "Frama-c")
+            self.javaLoc = None
+            self.speedyJarLoc = None
+            # alt-ergo is generally placed in the same directory as frama-c. If it is not found
+            # in path, Frama-c throws following Error: Alt-Ergo exits with status [127]
+            framac_dir = os.path.dirname(self.framacLoc)
+            self.env["PATH"] = str(framac_dir) + os.pathsep + self.env.get("PATH", "")
+            self.versions["Frama-c"] = tool_version([self.framacLoc, '-version'], self.env)
+            alt_ergo_loc = find_executable("alt-ergo", path=self.env["PATH"])
+            if alt_ergo_loc is None:
+                print("WARNING: Alt-Ergo not found next to Frama-c or in PATH, WP can only use other provers")
+            else:
+                self.versions["Alt-Ergo"] = tool_version([alt_ergo_loc, '-version'], self.env)
+            self.framacCommand = (self.framacLoc,)
+            self.speedyCommand = None
+        self.frozen = True
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get("frozen", False):
+            raise AttributeError("LaunchTemplate is read-only, cannot set " + name)
+        self.__dict__[name] = value
+
+    def __repr__(self):
+        return 'LaunchTemplate(frama-c=%s, java=%s, speedy=%s, versions=%s)' \
+            % (self.framacLoc, self.javaLoc, self.speedyJarLoc, self.versions)
+
+    def version(self, tool):
+        """ Returns the version of the tool, None if unknown """
+        return self.versions.get(tool, None)
+
+    def framac_command(self, args):
+        return list(self.framacCommand) + args
+
+    def speedy_command(self, cpp_command, run_wp, wp_args, temp_fs_cu):
+        cmd = list(self.speedyCommand)
+        if run_wp:
+            cmd.append('-framac-wp')
+        cmd.extend(['-cppflags', cpp_command, '-output', self.outputDir])
+        if wp_args and run_wp:
+            cmd.extend(['-framac-wp-check-args', "\"" + wp_args.replace("\"", "'") + "\""])
+        cmd.append(temp_fs_cu)
+        return cmd
+
+    def popen(self, cmd):
+        return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=self.workingDir,
+                                env=dict(self.env), shell=False)
+
+    def report(self):
+        """ Returns a message with the versions of the tools """
+        return "Tool versions: " + ', '.join(["%s %s" % (tool, self.versions[tool] or "unknown")
+                                              for tool in sorted(self.versions)])
+
+
+# Returns the absolute path of the executable, looked for in PATH if it has no directory
+def resolve_executable(location, tool):
+    if os.path.dirname(location):
+        if os.path.isfile(location) and os.access(location, os.X_OK):
+            return os.path.abspath(location).replace("\\", "/")
+        raise Exception('ERROR: ' + tool + ' executable doesn\'t exist at location: ' + location)
+    path = find_executable(location)
+    if path is None:
+        raise Exception('ERROR: ' + tool + ' executable ' + location + ' not found in PATH')
+    return os.path.abspath(path).replace("\\", "/")
+
+# Returns the absolute path of the file, looked for in the current directory then in PATH
+def resolve_file(location, tool):
+    if os.path.isfile(location):
+        return os.path.abspath(location).replace("\\", "/")
+    if not os.path.dirname(location):
+        for directory in os.environ.get("PATH", "").split(os.pathsep):
+            if os.path.isfile(os.path.join(directory, location)):
+                return os.path.abspath(os.path.join(directory, location)).replace("\\", "/")
+    raise Exception('ERROR: ' + tool + ' executable doesn\'t exist at location: ' + location)
+
+# Quotes WP flags for -framac-wp-check-args option of Speedy
+def quote_speedy_wp_flags(wp_flags):
+    wp_flag = ""
+    for s in wp_flags:
+        if " " in s.strip():
+            wp_flag = wp_flag + " " + "\'" + s.strip() + "\'"
+        else:
+            wp_flag = wp_flag + " " + s.strip()
+    return wp_flag.strip()
+
+# Returns the first line printed by the tool with its version option, None if it can't be run
+def tool_version(cmd, env):
+    try:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env, shell=False)
+        output = process.communicate()[0]
+    except OSError:
+        return None
+    if not isinstance(output, str):
+        output = output.decode("utf-8", "replace")
+    lines = output.strip().splitlines()
+    return lines[0].strip() if lines else None
@@ -19,6 +19,8 @@ LEMMA_GOAL = re.compile(r'\s*Lemma\s*(\S+)(?:[^:]*)?:\s*$')
 
 WP_WARNING = re.compile(r'\s*((?:\S)*):(\d+)\s*:\s*((?:\[wp\] warning))\s*:((?:\s|\S)*)$')
 KERNEL_ERROR = re.compile(r'\s*((?:\S)*):(\d+)\s*:\s*((?:\[kernel\] user error)|(?:\[kernel\] failure))\s*:((?:\s|\S)*)$')
+# Any fatal kernel error, with or without location. Frama-C stops the analysis after it.
+KERNEL_FATAL_ERROR = re.compile(r'\[kernel\] (?:user error|failure)', re.IGNORECASE)
 KERNEL_WARNING =re.compile(r'\s*((?:\S)*):(\d+)\s*:\s*((?:\[kernel\] warning))\s*:((?:\s|\S)*)$') 
 
 # New Warning Class
@@ -28,6 +30,18 @@ spec_warning_wc = cs.analysis.create_warningclass('Specification Warning', '', 1
 spec_error_wc = cs.analysis.create_warningclass('Specification Error','', 10.0, cs.warningclass_flags.PADDING, cs.warning_significance.DIAGNOSTIC)
 speedy_error_wc = cs.analysis.create_warningclass('Speedy Error','', 10.0, cs.warningclass_flags.PADDING, cs.warning_significance.DIAGNOSTIC)
 
+# Warning classes by name, used to report again warnings stored by a previous run
+WARNING_CLASSES = {
+    'Specification Violation' : spec_violation_wc,
+    'Specification Warning' : spec_warning_wc,
+    'Specification Error' : spec_error_wc,
+    'Speedy Error' : speedy_error_wc
+    }
+
+
+class KernelError(Exception):
+    """ Exception raised when Frama-C reports a fatal kernel error and fail-fast is enabled """
+    pass
 
 class GoalDefinition:
     """ Class to store information about a Frama-c Goal definition """
@@ -55,7 +69,14 @@ class CallSiteDefintion:
         return 'CallSiteDefintion(toFunctionName=%s, fromFunctionName=%s, onLineNumber=%d, inFileWithName=%s, info=%s )' \
             % (self.toFunctionName, self.fromFunctionName, self.onLineNumber, self.inFileWithName, self.info)
     
-def parseResultFromOutput(process, output_file, sfile_dict, proc_dict):
+# If report_log is a list, every created codesonar warning is also appended to it
+# as [warning class name, function, file, line, message, wp function], wp function being the
+# function whose WP section the goal was found in (see create_codesonar_warning).
+# If tag is given (e.g. the name of the WP profile), messages are prefixed with it.
+# If fail_fast is True, KernelError is raised as soon as a fatal kernel error is read, without
+# waiting for the end of the output.
+# Returns the number of proved goals and the total number of goals.
+def parseResultFromOutput(process, output_file, sfile_dict, proc_dict, report_log=None, tag=None, fail_fast=False):
     provedGoalsChecksum = None
     totalGoalsChecksum = None
     consumedGoalDefs = 0
@@ -76,7 +97,8 @@ def parseResultFromOutput(process, output_file, sfile_dict, proc_dict):
             raise Exception(line)
         
         # check for kernel error and WP warnings
-        checkForErrorOrWarning(line,sfile_dict, proc_dict)
+        if checkForErrorOrWarning(line,sfile_dict, proc_dict, report_log, tag) and fail_fast:
+            raise KernelError(line.strip())
         
         match = PROVED_GOALS.search(line)
         if match is not None:
@@ -225,13 +247,15 @@ def parseResultFromOutput(process, output_file, sfile_dict, proc_dict):
                     if goalTopic:
                         goal_info = goalTopic.strip()
                     functionName = parsing_goal_def.forFunctionName if parsing_goal_def.forFunctionName else ""
+                    # goals of a call site are named after the callee but are proved with the caller
+                    wpFunction = currentFunction if currentFunction else functionName
                     create_codesonar_warning(parsing_goal_def.forFunctionName, 
                                              parsing_goal_def.inFileWithName, 
                                              parsing_goal_def.onLineNumber, 
                                              "result for goal for function " + 
                                               functionName +
                                              ": Violated "+  goal_info +" - "+goalerror,
-                                             sfile_dict, proc_dict, spec_violation_wc)
+                                             sfile_dict, proc_dict, spec_violation_wc, report_log, tag, wpFunction)
                     if call_site_def is not None:
                         create_codesonar_warning(call_site_def.toFunctionName, 
                                                  call_site_def.inFileWithName,
@@ -239,7 +263,7 @@ def parseResultFromOutput(process, output_file, sfile_dict, proc_dict):
                                                  "result for goal for function " + 
                                                  call_site_def.toFunctionName +
                                                  ": Violated "+   call_site_def.info.strip() +" - "+goalerror,
-                                                 sfile_dict, proc_dict, spec_violation_wc)
+                                                 sfile_dict, proc_dict, spec_violation_wc, report_log, tag, wpFunction)
                 parsing_goal_def = None
                 call_site_def = None
                 goalTopic = None
@@ -258,13 +282,21 @@ def parseResultFromOutput(process, output_file, sfile_dict, proc_dict):
     if positiveProvedGoals + negativeProvedGoals !=  totalGoalsChecksum:
         raise Exception("Number of total goals and number of proofs does not match (%d <> %d)!" 
                         % ( positiveProvedGoals + negativeProvedGoals, totalGoalsChecksum))
+    return provedGoalsChecksum, totalGoalsChecksum
     
         
-def create_codesonar_warning (function, file, line, msg, sfile_dict, proc_dict, warning_class):
+# wp_function is the function WP was proving when it printed the message, "" for a WP message
+# printed outside of a function section and None for a message of the kernel.
+def create_codesonar_warning (function, file, line, msg, sfile_dict, proc_dict, warning_class, report_log=None, tag=None,
+                              wp_function=None):
     # print ("create warning - %s in file %s " % (msg, file))
     if file is not None and line is not None and msg is not None:
-        updated_file = process_framac_format_file(file)
-        if updated_file in sfile_dict:
+        msg = tag_message(msg, tag)
+        if report_log is not None:
+            class_name = [name for name, wc in WARNING_CLASSES.items() if wc is warning_class][0]
+            report_log.append([class_name, function, file, line, msg, wp_function])
+        updated_file = find_sfile_key(file, sfile_dict)
+        if updated_file is not None:
             sf = sfile_dict[updated_file]
             procedures =  sf.procedures_on_line(line)
             if procedures is not None and len(procedures) >0:
@@ -280,9 +312,29 @@ def create_codesonar_warning (function, file, line, msg, sfile_dict, proc_dict,
             else:            
                 warning_class.report(sf.arbitrary_instance(), line, msg)
         else:
-            print("WARNING: Cannot create codesonar warning class in file %s " % (updated_file))
+            print("WARNING: Cannot create codesonar warning class in file %s " % (process_framac_format_file(file)))
         
     
+# Prefix the message of a warning with the tag (e.g. the name of the WP profile), if any
+def tag_message(msg, tag):
+    if tag:
+        return "[" + tag + "] " + msg
+    return msg
+
+# Create again the codesonar warnings logged by parseResultFromOutput
+def replay_codesonar_warnings(reports, sfile_dict, proc_dict):
+    for class_name, function, file, line, msg, wp_function in reports:
+        create_codesonar_warning(function, file, line, msg, sfile_dict, proc_dict, WARNING_CLASSES[class_name])
+    
+# Returns the key of sfile_dict for a file name found in the output, None if the file is not in sfile_dict
+def find_sfile_key(file, sfile_dict):
+    if file in sfile_dict:
+        return file
+    updated_file = process_framac_format_file(file)
+    if updated_file in sfile_dict:
+        return updated_file
+    return None
+
 def process_framac_format_file (file_path):
     # for few warning frama-c generate output with relative path
     new_path = ""
@@ -305,26 +357,29 @@ def process_framac_posix_format_file (file_path):
             return f.replace("\\", "/")
     return file_path.replace("\\", "/")
         
-def checkForErrorOrWarning(line, sfile_dict, proc_dict):
+# Returns True if the line is a fatal kernel error
+def checkForErrorOrWarning(line, sfile_dict, proc_dict, report_log=None, tag=None):
+    fatal = KERNEL_FATAL_ERROR.search(line) is not None
     if KERNEL_ERROR.search(line) is not None:
         kernel_error = KERNEL_ERROR.search(line)
         file = kernel_error.group(1)
         line = int (kernel_error.group(2))
         create_codesonar_warning(None, file, line,
                                  kernel_error.group(3)+":"+ kernel_error.group(4),
-                                 sfile_dict,proc_dict, spec_error_wc)
+                                 sfile_dict,proc_dict, spec_error_wc, report_log, tag)
     elif KERNEL_WARNING.search(line) is not None:
         kernel_warning = KERNEL_WARNING.search(line)
         file = kernel_warning.group(1)
         line = int (kernel_warning.group(2))
         create_codesonar_warning(None, file, line,
                                  kernel_warning.group(3)+":"+ kernel_warning.group(4),
-                                 sfile_dict,proc_dict, spec_warning_wc)
+                                 sfile_dict,proc_dict, spec_warning_wc, report_log, tag)
     elif WP_WARNING.search(line) is not None:
         wp_warning = WP_WARNING.search(line)
         file = wp_warning.group(1)
         line = int (wp_warning.group(2))
         create_codesonar_warning(None, file, line,
                                  wp_warning.group(3)+":"+ wp_warning.group(4),
-                                 sfile_dict,proc_dict, spec_warning_wc)
+                                 sfile_dict,proc_dict, spec_warning_wc, report_log, tag, "")
+    return fatal
     
\ No newline at end of file
@@ -0,0 +1,138 @@
+# Live progress of an analysis by execute_framac_speedy plugin.
+#
+# A background thread rewrites a JSON status file every few seconds with the number of
+# compilation units done and remaining, the goals proved and failed so far, the running
+# jobs and how long they have been running, the number of output lines parsed per second
+# and an estimated completion time. The file is replaced atomically, so it can be read
+# at any time, e.g. to find a stalled job while the analysis is still running.
+#
+# Completion time is estimated from the mean time per compilation unit done so far, so it
+# is only meaningful once a few compilation units are done.
+
+import time
+import threading
+import json_file
+
+
+class LineCounter:
+    """ Class to count the lines read from the output of a process """
+
+    def __init__(self, stream, monitor):
+        self.stream = stream
+        self.monitor = monitor
+
+    def readline(self):
+        line = self.stream.readline()
+        if line:
+            self.monitor.add_lines(1)
+        return line
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class CountedProcess:
+    """ Class to give the output of a process to a parser while counting its lines """
+
+    def __init__(self, process, monitor):
+        self.process = process
+        self.stdout = LineCounter(process.stdout, monitor)
+
+    def __getattr__(self, name):
+        return getattr(self.process, name)
+
+
+class ProgressMonitor(threading.Thread):
+    """ Thread writing the progress of the analysis to a JSON status file """
+
+    def __init__(self, statusFile, interval, totalCompunits, summary, governor):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.statusFile = statusFile
+        self.interval = interval
+        self.totalCompunits = totalCompunits
+        self.summary = summary
+        self.governor = governor
+        self.startTime = time.time()
+        self.provedGoals = 0
+        self.failedGoals = 0
+        self.lines = 0
+        self.lastLines = 0
+        self.lastTime = self.startTime
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def __repr__(self):
+        return 'ProgressMonitor(file=%s, compunits=%d, goals=%d/%d, lines=%d)' \
+            % (self.statusFile, self.totalCompunits, self.provedGoals, self.provedGoals + self.failedGoals, self.lines)
+
+    def counted(self, process):
+        """ Returns the process, with the lines read from its output counted """
+        return CountedProcess(process, self)
+
+    def add_lines(self, count):
+        self.lock.acquire()
+        try:
+            self.lines = self.lines + count
+        finally:
+            self.lock.release()
+
+    def add_goals(self, proved, total):
+        self.lock.acquire()
+        try:
+            self.provedGoals = self.provedGoals + proved
+            self.failedGoals = self.failedGoals + total - proved
+        finally:
+            self.lock.release()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                # e.g. disk full, try again next time rather than stopping the updates
+                print("WARNING: Cannot write status file %s: %s" % (self.statusFile, e))
+
+    def stop(self):
+        """ Stops the thread and writes the final status """
+        if self.is_alive():
+            self.stopped.set()
+            self.join()
+        self.write()
+
+    def status(self):
+        now = time.time()
+        self.lock.acquire()
+        try:
+            lines_per_second = (self.lines - self.lastLines) / max(now - self.lastTime, 0.001)
+            self.lastLines = self.lines
+            self.lastTime = now
+            counts = dict(self.summary.counts())
+            done = sum(counts.values())
+            remaining = max(self.totalCompunits - done, 0)
+            elapsed = now - self.startTime
+            eta = elapsed / done * remaining if done > 0 else None
+            return {
+                "updated" : time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)),
+                "elapsed_seconds" : round(elapsed, 1),
+                "compunits" : {
+                    "total" : self.totalCompunits,
+                    "done" : done,
+                    "remaining" : remaining,
+                    "statuses" : counts
+                    },
+                "goals" : {"proved" : self.provedGoals, "failed" : self.failedGoals},
+                "jobs" : [{"name" : name, "cores" : cores, "elapsed_seconds" : round(seconds, 1)}
+                          for name, cores, seconds in self.governor.running_jobs()],
+                "lines_parsed" : self.lines,
+                "lines_per_second" : round(lines_per_second, 1),
+                "eta_seconds" : round(eta, 1) if eta is not None else None,
+                "estimated_completion" : time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now + eta)) if eta is not None else None
+                }
+        finally:
+            self.lock.release()
+
+    def write(self):
+        if not self.statusFile:
+            return
+        json_file.write_json(self.statusFile, self.status(), 4)
@@ -0,0 +1,63 @@
+# Summary of an analysis by execute_framac_speedy plugin: what happened to each compilation
+# unit, and why the failed ones failed. The summary is written to a JSON file after each
+# compilation unit, so that it is available even if the analysis is interrupted.
+
+import threading
+import json_file
+
+# Status of a compilation unit
+ANALYSED = "analysed"   # Frama-C or Speedy was executed successfully
+REUSED = "reused"       # results of the previous run were used (incremental mode)
+SKIPPED = "skipped"     # nothing to prove
+FAILED = "failed"       # Frama-C or Speedy failed on the compilation unit
+
+STATUSES = [ANALYSED, REUSED, SKIPPED, FAILED]
+
+
+class RunSummary:
+    """ Class to record the status of each compilation unit of an analysis """
+
+    def __init__(self, summaryFile):
+        self.summaryFile = summaryFile
+        self.statuses = {}
+        self.failures = {}
+        # reentrant, as counts() is also called by write() and by the progress thread
+        self.lock = threading.RLock()
+
+    def __repr__(self):
+        return 'RunSummary(%s)' % (', '.join(["%s=%d" % (status, count) for status, count in self.counts()]))
+
+    def counts(self):
+        self.lock.acquire()
+        try:
+            return [(status, len([cu for cu in self.statuses if self.statuses[cu] == status])) for status in STATUSES]
+        finally:
+            self.lock.release()
+
+    def record(self, cu_name, status, reason=None):
+        self.lock.acquire()
+        try:
+            self.statuses[cu_name] = status
+            if status == FAILED:
+                self.failures[cu_name] = reason if reason else ""
+            elif cu_name in self.failures:
+                del self.failures[cu_name]
+            self.write()
+        finally:
+            self.lock.release()
+
+    def write(self):
+        if not self.summaryFile:
+            return
+        summary = {
+            "compunits" : dict(self.counts()),
+            "failures" : [{"compunit" : cu_name, "reason" : self.failures[cu_name]} for cu_name in sorted(self.failures)]
+            }
+        json_file.write_json(self.summaryFile, summary, 4)
+
+    def report(self):
+        """ Returns a message summarizing the analysis """
+        lines = ["Compilation units: " + ', '.join(["%d %s" % (count, status) for status, count in self.counts()])]
+        for cu_name in sorted(self.failures):
+            lines.append("  FAILED " + cu_name + ": " + self.failures[cu_name])
+        return "\n".join(lines)
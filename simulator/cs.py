@@ -0,0 +1,257 @@
+# Minimal stand-in for the codesonar "cs" module, used by run_simulation.py to load
+# execute_framac_speedy plugin outside of codesonar.
+#
+# Only the parts of the API used by the plugin are provided. Projects are built by
+# make_project, which generates synthetic sfiles, compilation units and include graphs.
+
+import random
+
+def project_visitor(function):
+    return function
+
+def compunit_visitor(function):
+    return function
+
+
+class warningclass_flags:
+    PADDING = 0
+
+class warning_significance:
+    DIAGNOSTIC = 0
+
+class language:
+    C = "C"
+    CXX = "C++"
+
+
+class WarningClass:
+    """ Warning class counting the reported warnings """
+
+    def __init__(self, name):
+        self.name = name
+        self.reports = 0
+
+    def report(self, *args):
+        self.reports = self.reports + 1
+
+    def __repr__(self):
+        return 'WarningClass(name=%s, reports=%d)' % (self.name, self.reports)
+
+class analysis:
+    warning_classes = []
+
+    @staticmethod
+    def create_warningclass(name, description, rank, flags, significance):
+        warning_class = WarningClass(name)
+        analysis.warning_classes.append(warning_class)
+        return warning_class
+
+
+class Procedure:
+
+    def __init__(self, name, sfile, firstLine, lastLine):
+        self.name = name
+        self.sfile = sfile
+        self.firstLine = firstLine
+        self.lastLine = lastLine
+        self.callSites = []
+
+    def __str__(self):
+        return self.name
+
+    def call_sites(self):
+        return self.callSites
+
+class CallSite:
+
+    def __init__(self, callee):
+        self.callee = callee
+
+    def callees(self):
+        return [self.callee]
+
+class SFile:
+
+    def __init__(self, path, lines):
+        self.path = path
+        self.lines = lines
+        self.procedures = []
+        self.includes = [] # (sfile or system header name, line) pairs
+        self.instances = []
+
+    def __str__(self):
+        return self.path
+
+    def procedures_on_line(self, line):
+        return [proc for proc in self.procedures if proc.firstLine <= line <= proc.lastLine]
+
+    def arbitrary_instance(self):
+        return self.instances[0]
+
+class SFileInst:
+
+    def __init__(self, sfile, parent, systemInclude=False):
+        self.sfile = sfile
+        self.parentInst = parent
+        self.systemInclude = systemInclude
+        self.children = []
+        self.compunit = None
+        self.compunitLine = None
+
+    def __str__(self):
+        return str(self.sfile)
+
+    def is_system_include(self):
+        return self.systemInclude
+
+    def get_sfile(self):
+        return self.sfile
+
+    def parent(self):
+        return self.parentInst
+
+    def children_vector(self):
+        return self.children
+
+    def line_count(self):
+        return len(self.sfile.lines)
+
+    def read(self, first_line, first_column, last_line, last_column):
+        return "\n".join(self.sfile.lines[first_line-1:last_line-1]) + "\n"
+
+    def line_to_compunit_line(self, line):
+        return self.compunit, self.compunitLine
+
+class CompUnit:
+
+    def __init__(self, name, sfileinst, flags):
+        self.name = name
+        self.sfileinst = sfileinst
+        self.flags = flags
+        # compunit line -> (includer sfile instance, line of the include)
+        self.lineMap = {}
+
+    def __str__(self):
+        return self.name
+
+    def is_user(self):
+        return True
+
+    def get_language(self):
+        return language.C
+
+    def get_sfileinst(self):
+        return self.sfileinst
+
+    def effective_compiler_flags(self):
+        return self.flags
+
+    def procedures(self):
+        return self.sfileinst.get_sfile().procedures
+
+    def line_to_sfileinst_line(self, line):
+        return self.lineMap[line]
+
+
+class project:
+    CURRENT = None
+
+    def __init__(self, name):
+        self.projectName = name
+        self.sfileList = []
+        self.compunitList = []
+
+    def name(self):
+        return self.projectName
+
+    def sfiles(self):
+        return self.sfileList
+
+    def compunits(self):
+        return self.compunitList
+
+    @staticmethod
+    def current():
+        return project.CURRENT
+
+
+def generate_file(path, name_prefix, includes, functions, body_lines, annotated):
+    """ Returns a SFile with the given includes, followed by functions with an ACSL contract when annotated.
+        Each function calls the previous one. """
+    lines = []
+    sfile = SFile(path, lines)
+    for included, system in includes:
+        if system:
+            lines.append("#include <" + included + ">")
+            sfile.includes.append((included, len(lines)))
+        else:
+            lines.append("#include \"" + str(included).split("/")[-1] + "\"")
+            sfile.includes.append((included, len(lines)))
+    lines.append("")
+    lines.append("int " + name_prefix + "_global;")
+    for k in range(0, functions):
+        name = "%s_f%d" % (name_prefix, k)
+        if annotated:
+            lines.append("/*@ requires x >= 0;")
+            lines.append("    ensures \\result >= x; */")
+        first = len(lines) + 1
+        lines.append("int " + name + "(int x) {")
+        lines.append("    int y = x;")
+        if k > 0:
+            lines.append("    y = %s_f%d(y);" % (name_prefix, k - 1))
+        for i in range(0, body_lines):
+            lines.append("    y = y + %d;" % (i % 7))
+        lines.append("    return y;")
+        lines.append("}")
+        procedure = Procedure(name, sfile, first, len(lines))
+        if k > 0:
+            procedure.callSites.append(CallSite(sfile.procedures[-1]))
+        sfile.procedures.append(procedure)
+        lines.append("")
+    return sfile
+
+def instantiate(sfile, parent, compunit, line_counter, visited):
+    """ Creates the sfile instance tree of sfile in the compilation unit """
+    sinst = SFileInst(sfile, parent)
+    sinst.compunit = compunit
+    sfile.instances.append(sinst)
+    if sfile in visited:
+        # as if guarded by an include guard, nothing is included the second time
+        return sinst
+    visited.add(sfile)
+    for included, line in sfile.includes:
+        if isinstance(included, SFile):
+            child = instantiate(included, sinst, compunit, line_counter, visited)
+        else:
+            child = SFileInst(included, sinst, True)
+            child.compunit = compunit
+        line_counter[0] = line_counter[0] + 1
+        child.compunitLine = line_counter[0]
+        compunit.lineMap[line_counter[0] - 1] = (sinst, line)
+        sinst.children.append(child)
+    return sinst
+
+def make_project(name, compunits, headers, includes_per_file, functions, body_lines, annotated_ratio, seed=0):
+    """ Generates a project and sets it as the current one """
+    rng = random.Random(seed)
+    proj = project(name)
+    header_files = []
+    for h in range(0, headers):
+        # headers only include headers generated before them, so the include graph has no cycle
+        candidates = header_files[max(0, h - 50):h]
+        includes = [(included, False) for included in rng.sample(candidates, min(len(candidates), includes_per_file // 2))]
+        header = generate_file("/sim/include/hdr_%d.h" % h, "hdr%d" % h, includes, 1, body_lines,
+                               rng.random() < annotated_ratio)
+        header_files.append(header)
+    proj.sfileList.extend(header_files)
+    for c in range(0, compunits):
+        includes = [(included, False) for included in rng.sample(header_files, min(headers, includes_per_file))]
+        includes.append(("stdio.h", True))
+        source = generate_file("/sim/src/unit_%d.c" % c, "unit%d" % c, includes, functions, body_lines,
+                               rng.random() < annotated_ratio)
+        proj.sfileList.append(source)
+        compunit = CompUnit("/sim/src/unit_%d.c" % c, None, ["gcc", "-DSIMULATION", "-I/sim/include"])
+        compunit.sfileinst = instantiate(source, None, compunit, [1], set())
+        proj.compunitList.append(compunit)
+    project.CURRENT = proj
+    return proj
@@ -0,0 +1,231 @@
+# Scale simulation of execute_framac_speedy plugin.
+#
+# Runs setup, generate_temp_filesystem, execute_framac and execute_speedy on a synthetic
+# project (see cs.py) with stub frama-c and java executables (see stub_framac.py and
+# stub_speedy.py), and measures the plugin's own cost:
+#   - overhead per compilation unit, i.e. wall time minus the lifetime of the stub processes,
+#     from their start to their exit (written by the stubs to SIM_TIMES_FILE),
+#   - time spent and bytes written creating the temporary filesystem,
+#   - time spent interpreting the output and reporting codesonar warnings.
+#
+# It must be run with the Python used by codesonar (2.7), e.g.:
+#   python simulator/run_simulation.py --compunits 2000 --headers 3000 --latency 0.01
+#
+# With --max-overhead-ms, it exits with status 1 when the mean overhead per compilation unit
+# is higher, so that it can guard the plugin overhead in a CI job.
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+SIMULATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.dirname(SIMULATOR_DIR)
+
+# the stub "cs" module must be found before the plugin is imported
+sys.path.insert(0, PLUGIN_DIR)
+sys.path.insert(0, SIMULATOR_DIR)
+import cs
+
+
+class Measures:
+    """ Class to accumulate time and volume measures of a simulation """
+
+    def __init__(self):
+        self.tempFsSeconds = 0.0
+        self.bytesWritten = 0
+        self.filesWritten = 0
+        self.jobSeconds = 0.0
+        self.jobs = 0
+        # pid of each started tool process -> (index of its compilation unit, start time)
+        self.toolStarts = {}
+        self.reportSeconds = 0.0
+        self.compunitSeconds = []
+
+    def timed(self, function, attribute):
+        """ Returns function, adding its execution time to the given attribute """
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                setattr(self, attribute, getattr(self, attribute) + time.time() - start)
+        return wrapper
+
+    def counting_writes(self, write_to_file):
+        def wrapper(file, content):
+            self.filesWritten = self.filesWritten + 1
+            self.bytesWritten = self.bytesWritten + sum([len(item) + 1 for item in content])
+            return write_to_file(file, content)
+        return wrapper
+
+    def timing_tools(self, popen):
+        def wrapper(launcher, cmd):
+            start = time.time()
+            process = popen(launcher, cmd)
+            self.toolStarts[process.pid] = (len(self.compunitSeconds), start)
+            return process
+        return wrapper
+
+    def tool_seconds(self, times_file):
+        """ Returns the lifetime of the tool processes of each compilation unit, from their exit times """
+        seconds = [0.0] * len(self.compunitSeconds)
+        if not os.path.exists(times_file):
+            return seconds
+        with open(times_file) as data_file:
+            for line in data_file:
+                pid, end = line.split()
+                if int(pid) in self.toolStarts:
+                    index, start = self.toolStarts.pop(int(pid))
+                    seconds[index] = seconds[index] + float(end) - start
+        return seconds
+
+    def counting_jobs(self, run):
+        def wrapper(*args, **kwargs):
+            self.jobs = self.jobs + 1
+            return run(*args, **kwargs)
+        return self.timed(wrapper, "jobSeconds")
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Scale simulation of execute_framac_speedy plugin")
+    parser.add_argument("--compunits", type=int, default=1000, help="number of compilation units")
+    parser.add_argument("--headers", type=int, default=2000, help="number of header sfiles")
+    parser.add_argument("--includes", type=int, default=10, help="headers included by each compilation unit")
+    parser.add_argument("--functions", type=int, default=5, help="functions defined in each compilation unit")
+    parser.add_argument("--body-lines", type=int, default=20, help="lines in each function body")
+    parser.add_argument("--annotated-ratio", type=float, default=0.5, help="ratio of sfiles with ACSL annotations")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds spent by each stub tool run")
+    parser.add_argument("--goals", type=int, default=20, help="goals printed by each stub tool run")
+    parser.add_argument("--failed-ratio", type=float, default=0.1, help="ratio of goals not proved")
+    parser.add_argument("--warnings", type=int, default=2, help="kernel warnings printed by each stub tool run")
+    parser.add_argument("--kernel-error-ratio", type=float, default=0.0, help="ratio of compilation units with a kernel error")
+    parser.add_argument("--speedy", action="store_true", help="execute Frama-C via the Speedy stub")
+    parser.add_argument("--config", default=None, help="JSON file with plugin options overriding the simulation ones")
+    parser.add_argument("--work-dir", default=None, help="directory for temporary files (default: a new temp directory)")
+    parser.add_argument("--json", default=None, help="file to write the measures to, as JSON")
+    parser.add_argument("--max-overhead-ms", type=float, default=None, help="fail if mean overhead per compilation unit is higher")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic project generation")
+    return parser.parse_args(argv)
+
+def write_configuration(args, work_dir):
+    """ Writes the plugin configuration file pointing to the stubs and returns its path """
+    java_home = os.path.join(work_dir, "java-home")
+    if not os.path.exists(os.path.join(java_home, "bin")):
+        os.makedirs(os.path.join(java_home, "bin"))
+    java_stub = os.path.join(java_home, "bin", "java")
+    shutil.copy(os.path.join(SIMULATOR_DIR, "stub_speedy.py"), java_stub)
+    os.chmod(java_stub, 0o755)
+    framac_stub = os.path.join(SIMULATOR_DIR, "stub_framac.py")
+    os.chmod(framac_stub, 0o755)
+
+    config = {
+        "TEMP_DIR" : os.path.join(work_dir, "temp"),
+        "FRAMAC_LOC" : framac_stub,
+        "SPEEDY_JAR_LOC" : java_stub,
+        "JAVA_HOME" : java_home,
+        "FRAMAC_WP_FLAGS" : [],
+        "USE_SPEEDY" : "Yes" if args.speedy else "No",
+        "JOB_HISTORY_FILE" : os.path.join(work_dir, "jobs.json"),
+        "INCREMENTAL_DIR" : os.path.join(work_dir, "incremental")
+        }
+    if args.config:
+        with open(args.config) as data_file:
+            config.update(json.load(data_file))
+    config_file = os.path.join(work_dir, "execute_framac_speedy_config")
+    with open(config_file, 'w') as data_file:
+        json.dump(config, data_file, indent=4)
+    return config_file
+
+def run(args, work_dir):
+    os.environ["EXECUTE_FRAMAC_SPEEDY_CONFIG"] = write_configuration(args, work_dir)
+    os.environ["SIM_LATENCY"] = str(args.latency)
+    os.environ["SIM_GOALS"] = str(args.goals)
+    os.environ["SIM_FAILED_RATIO"] = str(args.failed_ratio)
+    os.environ["SIM_WARNINGS"] = str(args.warnings)
+    os.environ["SIM_KERNEL_ERROR_RATIO"] = str(args.kernel_error_ratio)
+    times_file = os.path.join(work_dir, "tool_times.txt")
+    os.environ["SIM_TIMES_FILE"] = times_file
+
+    start = time.time()
+    project = cs.make_project("simulation", args.compunits, args.headers, args.includes, args.functions,
+                              args.body_lines, args.annotated_ratio, args.seed)
+    generation_seconds = time.time() - start
+
+    import process_wp_output
+    import launcher
+    import execute_framac_speedy as plugin
+
+    measures = Measures()
+    plugin.generate_temp_filesystem = measures.timed(plugin.generate_temp_filesystem, "tempFsSeconds")
+    plugin.write_to_file = measures.counting_writes(plugin.write_to_file)
+    process_wp_output.create_codesonar_warning = measures.timed(process_wp_output.create_codesonar_warning, "reportSeconds")
+    plugin.process_commandLine_goal_output = measures.timed(plugin.process_commandLine_goal_output, "reportSeconds")
+    plugin.process_commandline_problemlistener_output = measures.timed(plugin.process_commandline_problemlistener_output, "reportSeconds")
+    launcher.LaunchTemplate.popen = measures.timing_tools(launcher.LaunchTemplate.popen)
+
+    start = time.time()
+    plugin.setup(project)
+    setup_seconds = time.time() - start
+    plugin.GOVERNOR.run = measures.counting_jobs(plugin.GOVERNOR.run)
+
+    start = time.time()
+    for compunit in project.compunits():
+        compunit_start = time.time()
+        plugin.execute_framac(compunit)
+        plugin.execute_speedy(compunit)
+        measures.compunitSeconds.append(time.time() - compunit_start)
+    analysis_seconds = time.time() - start
+    # as at exit of codesonar, but before the work directory is removed
+    plugin.report_end_of_run()
+
+    count = max(1, len(measures.compunitSeconds))
+    tool_seconds = measures.tool_seconds(times_file)
+    overheads = sorted([seconds - tool for seconds, tool in zip(measures.compunitSeconds, tool_seconds)]) or [0.0]
+    results = {
+        "compunits" : len(project.compunits()),
+        "sfiles" : len(project.sfiles()),
+        "jobs" : measures.jobs,
+        "project_generation_seconds" : generation_seconds,
+        "setup_seconds" : setup_seconds,
+        "analysis_seconds" : analysis_seconds,
+        "mean_overhead_ms" : 1000.0 * sum(overheads) / count,
+        "p95_overhead_ms" : 1000.0 * overheads[int(0.95 * (len(overheads) - 1))],
+        "temp_fs_seconds" : measures.tempFsSeconds,
+        "temp_fs_files_written" : measures.filesWritten,
+        "temp_fs_bytes_written" : measures.bytesWritten,
+        "job_seconds" : measures.jobSeconds,
+        "tool_seconds" : sum(tool_seconds),
+        "report_seconds" : measures.reportSeconds,
+        "summary" : dict(plugin.SUMMARY.counts()),
+        "reports" : dict([(wc.name, wc.reports) for wc in cs.analysis.warning_classes])
+        }
+    return results
+
+def main(argv):
+    args = parse_arguments(argv)
+    work_dir = os.path.abspath(args.work_dir or tempfile.mkdtemp(prefix="framac_simulation_"))
+    if not os.path.exists(work_dir):
+        os.makedirs(work_dir)
+    try:
+        results = run(args, work_dir)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    for key in sorted(results.keys()):
+        print("%-28s %s" % (key, results[key]))
+    if args.json:
+        with open(args.json, 'w') as data_file:
+            json.dump(results, data_file, indent=4)
+    if args.max_overhead_ms is not None and results["mean_overhead_ms"] > args.max_overhead_ms:
+        print("ERROR: mean overhead per compilation unit %.1f ms is higher than %.1f ms"
+              % (results["mean_overhead_ms"], args.max_overhead_ms))
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# Stub frama-c executable used by run_simulation.py. It ignores everything but the
+# analysed file and prints WP-like output for a number of goals:
+#   - a few kernel warnings, then the "Proved goals" summary,
+#   - the -wp-print section of each goal, some of them not proved.
+# With -save, the name of the analysed file is written to the state file, so that a later
+# run with -load prints the same goals without parsing (and without kernel warnings).
+#
+# With -version, only a version number is printed.
+#
+# Behaviour is configured with environment variables:
+#   SIM_LATENCY      seconds spent before printing the summary (default 0)
+#   SIM_GOALS        number of goals (default 10)
+#   SIM_FAILED_RATIO ratio of goals which are not proved (default 0.1)
+#   SIM_WARNINGS     number of kernel warnings (default 2)
+#   SIM_KERNEL_ERROR_RATIO ratio of analysed files on which a kernel user error is printed
+#                    before the goals, the exit status being then 1 (default 0)
+#   SIM_TIMES_FILE   file to which the pid and exit time of the process are appended, if set
+
+import os
+import sys
+import time
+import zlib
+
+def record_exit_time():
+    """ Appends the pid and the exit time of the process to SIM_TIMES_FILE, if set """
+    times_file = os.environ.get("SIM_TIMES_FILE", "")
+    if times_file:
+        with open(times_file, 'a') as data_file:
+            data_file.write("%d %f\n" % (os.getpid(), time.time()))
+
+def main(args):
+    latency = float(os.environ.get("SIM_LATENCY", "0"))
+    goals = int(os.environ.get("SIM_GOALS", "10"))
+    failed_ratio = float(os.environ.get("SIM_FAILED_RATIO", "0.1"))
+    warnings = int(os.environ.get("SIM_WARNINGS", "2"))
+    kernel_error_ratio = float(os.environ.get("SIM_KERNEL_ERROR_RATIO", "0"))
+
+    out = sys.stdout
+    if "-version" in args:
+        out.write("0.0 (Simulation)\n")
+        return 0
+    if "-load" in args:
+        with open(args[args.index("-load") + 1]) as state_file:
+            source = state_file.read().strip()
+    else:
+        source = [arg for arg in args if arg.endswith(".c")]
+        source = source[-1][2:] if source and source[-1].startswith("./") else (source[-1] if source else "main.c")
+        out.write("[kernel] Parsing %s (with preprocessing)\n" % source)
+        for i in range(0, warnings):
+            out.write("%s:%d:[kernel] warning: simulated warning %d\n" % (source, i + 1, i))
+    if "-save" in args:
+        with open(args[args.index("-save") + 1], 'w') as state_file:
+            state_file.write(source + "\n")
+    failed = int(goals * failed_ratio)
+    # same files fail on every run
+    kernel_error = zlib.crc32(source.encode()) % 1000 < kernel_error_ratio * 1000
+    if kernel_error:
+        out.write("%s:1:[kernel] user error: simulated kernel error\n" % source)
+        out.flush()
+
+    if "-wp" not in args:
+        return 1 if kernel_error else 0
+    out.write("[rte] annotating all functions\n")
+    out.write("[wp] %d goals scheduled\n" % goals)
+    out.flush()
+    time.sleep(latency)
+    out.write("[wp] Proved goals: %d / %d\n" % (goals - failed, goals))
+    for i in range(0, goals):
+        function = "f%d" % (i // 4)
+        if i % 4 == 0:
+            out.write("------------------------------------------------------------\n")
+            out.write("  Function %s\n" % function)
+            out.write("------------------------------------------------------------\n\n")
+        out.write("Goal Post-condition (file %s, line %d) in '%s':\n" % (source, 10 + i, function))
+        out.write("Assume { Type: is_sint32(x). }\n")
+        out.write("Prove: 0 <= x.\n")
+        result = "Unknown" if i < failed else "Valid"
+        out.write("Prover Alt-Ergo returns %s (%dms)\n\n" % (result, 3 + i % 20))
+    out.flush()
+    return 1 if kernel_error else 0
+
+if __name__ == "__main__":
+    try:
+        status = main(sys.argv[1:])
+    finally:
+        record_exit_time()
+    sys.exit(status)
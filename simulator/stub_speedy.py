@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# Stub java executable used by run_simulation.py in place of "java -jar SpeedyCore.jar".
+# It ignores everything but the analysed file and prints Speedy-like output: one
+# problem listener line per kernel warning and one (FramacWp) line per goal.
+# Exits with 2 when some goal is not satisfied and with 3 after a kernel error, as Speedy does.
+#
+# With -version, only a version number is printed, as java does.
+#
+# Behaviour is configured with the same environment variables as stub_framac.py.
+
+import os
+import sys
+import time
+import zlib
+
+def record_exit_time():
+    """ Appends the pid and the exit time of the process to SIM_TIMES_FILE, if set """
+    times_file = os.environ.get("SIM_TIMES_FILE", "")
+    if times_file:
+        with open(times_file, 'a') as data_file:
+            data_file.write("%d %f\n" % (os.getpid(), time.time()))
+
+def main(args):
+    latency = float(os.environ.get("SIM_LATENCY", "0"))
+    goals = int(os.environ.get("SIM_GOALS", "10"))
+    failed_ratio = float(os.environ.get("SIM_FAILED_RATIO", "0.1"))
+    warnings = int(os.environ.get("SIM_WARNINGS", "2"))
+    kernel_error_ratio = float(os.environ.get("SIM_KERNEL_ERROR_RATIO", "0"))
+
+    if "-version" in args:
+        sys.stderr.write("simulation version \"0.0\"\n")
+        return 0
+    source = [arg for arg in args if arg.endswith(".c")]
+    source = os.path.abspath(source[-1] if source else "main.c").replace("\\", "/")
+    failed = int(goals * failed_ratio)
+    if "-framac-wp" not in args:
+        goals = 0
+        failed = 0
+
+    out = sys.stdout
+    for i in range(0, warnings):
+        out.write("%s:%d:0:[kernel] warning: simulated warning %d\n" % (source, i + 1, i))
+    # same files fail on every run
+    kernel_error = zlib.crc32(os.path.basename(source).encode()) % 1000 < kernel_error_ratio * 1000
+    if kernel_error:
+        out.write("%s:1:0:[kernel] user error: simulated kernel error\n" % source)
+    out.flush()
+    time.sleep(latency)
+    for i in range(0, goals):
+        function = "f%d" % (i // 4)
+        if i < failed:
+            result = "Violated Post-condition - Unknown"
+        else:
+            result = "Satisfied"
+        out.write("%s:%d: (FramacWp) result for goal for function %s: %s\n" % (source, 10 + i, function, result))
+    out.flush()
+    if kernel_error:
+        return 3
+    return 2 if failed > 0 else 0
+
+if __name__ == "__main__":
+    try:
+        status = main(sys.argv[1:])
+    finally:
+        record_exit_time()
+    sys.exit(status)
@@ -0,0 +1,159 @@
+# Checks of the change-impact analysis of incremental mode (see incremental_analysis.py),
+# on sfiles of the stub "cs" module (see cs.py).
+#
+# They must be run with the Python used by codesonar (2.7), e.g.:
+#   python simulator/test_incremental_analysis.py
+
+import os
+import re
+import sys
+import unittest
+
+SIMULATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.dirname(SIMULATOR_DIR)
+
+# the stub "cs" module must be found before the plugin is imported
+sys.path.insert(0, PLUGIN_DIR)
+sys.path.insert(0, SIMULATOR_DIR)
+import cs
+import incremental_analysis
+
+FUNCTION_START = re.compile(r'^int (\w+)\(')
+CALL = re.compile(r'(\w+)\(y\)')
+
+SOURCE = [
+    "int counter;",
+    "",
+    "/*@ requires x >= 0; */",
+    "int f(int x) {",
+    "    return x;",
+    "}",
+    "",
+    "/* helper */",
+    "/*@ requires x >= 0; */",
+    "int g(int x) {",
+    "    int y = x;",
+    "    return f(y);",
+    "}",
+    "",
+    "int h(int x) {",
+    "    int y = x;",
+    "    return g(y);",
+    "}",
+    ]
+
+def make_sfile(lines):
+    """ Returns a stub sfile with a procedure for each function of the lines """
+    sfile = cs.SFile("/sim/src/unit.c", lines)
+    for i in range(0, len(lines)):
+        match = FUNCTION_START.search(lines[i])
+        if match is not None:
+            last = lines.index("}", i) + 1
+            sfile.procedures.append(cs.Procedure(match.group(1), sfile, i + 1, last))
+    return sfile
+
+def call_graph(sfile):
+    graph = {}
+    for procedure in sfile.procedures:
+        body = sfile.lines[procedure.firstLine:procedure.lastLine]
+        graph[procedure.name] = set([name for line in body for name in CALL.findall(line)])
+    return graph
+
+def digests_of(lines):
+    sfile = make_sfile(lines)
+    return incremental_analysis.compute_digests([(sfile, lines)], call_graph(sfile))
+
+def state_of(lines, reports=None):
+    """ Returns the state a run would have stored for the lines, with the given reports """
+    digests = digests_of(lines)
+    state = digests.to_state()
+    state["version"] = incremental_analysis.STATE_VERSION
+    state["signature"] = "signature"
+    state["reports"] = reports if reports is not None else []
+    return state
+
+def edited(lines, index, inserted):
+    """ Returns the lines with inserted lines before lines[index] """
+    return lines[:index] + inserted + lines[index:]
+
+
+class SelectProceduresTest(unittest.TestCase):
+
+    def select(self, old_lines, new_lines):
+        return incremental_analysis.select_procedures(state_of(old_lines), digests_of(new_lines), "signature")
+
+    def test_unchanged(self):
+        self.assertEqual(self.select(SOURCE, SOURCE), set())
+
+    def test_body_change_before_global_lines(self):
+        # the comment and contract after f move, but are not changed
+        new_lines = edited(SOURCE, SOURCE.index("    return x;"), ["    x = x + 1;"])
+        self.assertEqual(self.select(SOURCE, new_lines), set(["f"]))
+
+    def test_contract_change_selects_callers(self):
+        new_lines = list(SOURCE)
+        new_lines[8] = "/*@ requires x > 0; */"
+        self.assertEqual(self.select(SOURCE, new_lines), set(["g", "h"]))
+
+    def test_global_change(self):
+        new_lines = list(SOURCE)
+        new_lines[0] = "long counter;"
+        self.assertEqual(self.select(SOURCE, new_lines), None)
+
+    def test_moved_global_line(self):
+        new_lines = edited(SOURCE, SOURCE.index("/* helper */"), [""])
+        self.assertEqual(self.select(SOURCE, new_lines), None)
+
+    def test_signature_change(self):
+        self.assertEqual(incremental_analysis.select_procedures(state_of(SOURCE), digests_of(SOURCE), "other"), None)
+
+
+class ReusableReportsTest(unittest.TestCase):
+
+    def stored(self, lines, reports):
+        """ Returns the reports as stored by a run on the lines """
+        sfile_dict = {"unit.c" : make_sfile(lines)}
+        return incremental_analysis.to_stored_reports(reports, sfile_dict, lambda file: file, digests_of(lines))
+
+    def setUp(self):
+        self.reports = self.stored(SOURCE, [
+            # call of g in h, located on the contract of g but proved with h
+            ["Specification Violation", "g", "unit.c", 9, "pre-condition of g", "h"],
+            ["Specification Violation", "f", "unit.c", 5, "post-condition of f", "f"],
+            ["Specification Warning", None, "unit.c", 11, "[wp] warning: in g", ""],
+            ["Specification Warning", None, "unit.c", 1, "[kernel] warning: counter", None],
+            ])
+
+    def reused(self, reproved, lines=SOURCE):
+        reports = incremental_analysis.reusable_reports(state_of(SOURCE, self.reports), set(reproved), digests_of(lines))
+        return sorted([report[4] for report in reports])
+
+    def test_reports_of_the_caller_are_not_reused(self):
+        self.assertEqual(self.reused(["h"]), ["[wp] warning: in g", "post-condition of f"])
+
+    def test_wp_warnings_of_other_procedures_are_reused(self):
+        self.assertEqual(self.reused(["f"]), ["[wp] warning: in g", "pre-condition of g"])
+
+    def test_kernel_warnings_are_not_reused(self):
+        self.assertEqual(self.reused([]), ["[wp] warning: in g", "post-condition of f", "pre-condition of g"])
+
+    def test_reports_of_deleted_procedures_are_not_reused(self):
+        new_lines = SOURCE[:SOURCE.index("int h(int x) {") - 1]
+        self.assertEqual(self.reused([], new_lines), ["[wp] warning: in g", "post-condition of f"])
+
+    def test_reports_move_with_their_procedure(self):
+        new_lines = edited(SOURCE, SOURCE.index("    return x;"), ["    x = x + 1;", "    x = x - 1;"])
+        reports = incremental_analysis.from_stored_reports(self.reports, {}, digests_of(new_lines))
+        lines = dict([(report[4], report[3]) for report in reports])
+        self.assertEqual(lines["post-condition of f"], 5)
+        self.assertEqual(lines["pre-condition of g"], 11)
+        self.assertEqual(lines["[wp] warning: in g"], 13)
+        self.assertEqual(lines["[kernel] warning: counter"], 1)
+
+    def test_reported_again(self):
+        reused = [["Specification Warning", None, "unit.c", 11, "[wp] warning: in g", "g"]]
+        self.assertEqual(incremental_analysis.remove_reported(reused, [list(reused[0])]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()